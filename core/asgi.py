@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# Imported once Django is set up
+from warehouse.uploads import RequestBodyLimit  # noqa: E402
+
+application = RequestBodyLimit(application)
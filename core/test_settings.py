@@ -0,0 +1,38 @@
+"""
+Settings for the test suite: `python manage.py test --settings=core.test_settings`
+
+Two SQLite aliases stand in for the primary database and its read replica. The replica mirrors the primary's test
+database through a connection of its own, so tests that read from it must commit their data (TransactionTestCase).
+"""
+import tempfile
+from pathlib import Path
+
+from core.settings import *  # noqa: F401,F403
+
+TEST_ROOT = Path(tempfile.gettempdir())/'warehouse-tests'
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': TEST_ROOT/'db.sqlite3',
+        # A file rather than an in-memory database, which the replica connection could not read while it is written
+        'TEST': {'NAME': TEST_ROOT/'test-db.sqlite3'},
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': TEST_ROOT/'replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+TEST_ROOT.mkdir(exist_ok=True)
+
+# A single process, so a memory cache is shared by every request of a test
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+MEDIA_ROOT = TEST_ROOT/'uploads'
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
+from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
 
 from .models import (
@@ -11,6 +12,16 @@ from .models import (
     Supplier,
     User,
 )
+from .replicas import replica_reads
+
+
+class ReplicaChangeListMixin:
+    """
+    Serves the changelist page from the read replica
+    """
+    @method_decorator(replica_reads)
+    def changelist_view(self, request, extra_context=None):
+        return super().changelist_view(request, extra_context)
 
 
 @admin.register(User)
@@ -60,7 +71,7 @@ class PWResetTokenAdmin(admin.ModelAdmin):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = [
         'name',
         'supplier',
@@ -74,7 +85,7 @@ class ProductAdmin(admin.ModelAdmin):
 
 
 @admin.register(Supplier)
-class SupplierAdmin(admin.ModelAdmin):
+class SupplierAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = ("id", "name", "phone_number", "email")
 
 
@@ -85,7 +96,7 @@ class InvoiceProductInline(admin.TabularInline):
 
 
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
+class InvoiceAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = [
         'id',
         'invoice_number',
@@ -101,7 +112,7 @@ class InvoiceAdmin(admin.ModelAdmin):
 
 
 @admin.register(StockMovement)
-class StockMovementAdmin(admin.ModelAdmin):
+class StockMovementAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = [
         'id',
         'date',
@@ -116,5 +127,5 @@ class StockMovementAdmin(admin.ModelAdmin):
 
 
 @admin.register(InvoiceProduct)
-class InvoiceProductAdmin(admin.ModelAdmin):
+class InvoiceProductAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     pass
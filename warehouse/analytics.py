@@ -0,0 +1,133 @@
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Window
+from django.db.models.functions import Cast, Coalesce, Rank, TruncDate
+from django.utils import timezone
+
+from warehouse import models
+from warehouse.caching import is_shared_cache
+from warehouse.replicas import reading_from_replica
+
+ANALYTICS_VERSION_KEY = 'analytics:version'
+
+# stock_value is a float column, so cast it before multiplying with the decimal unit price
+STOCK_VALUE = ExpressionWrapper(
+    Cast('stock_value', DecimalField(max_digits=20, decimal_places=4)) * F('unit_price'),
+    output_field=DecimalField(max_digits=20, decimal_places=2)
+)
+
+
+def analytics_version():
+    return cache.get_or_set(ANALYTICS_VERSION_KEY, 1, None)
+
+
+def invalidate_analytics():
+    """
+    Bumps the version that all cached analytics results are keyed on
+    """
+    try:
+        cache.incr(ANALYTICS_VERSION_KEY)
+    except ValueError:
+        cache.set(ANALYTICS_VERSION_KEY, 1, None)
+
+
+def cached(name, params, compute):
+    """
+    Returns the cached result of `compute()` for the report `name` with `params`, computing it on a miss.
+    Entries expire after ANALYTICS_CACHE_TTL seconds and whenever `invalidate_analytics` is called, which only
+    reaches every worker through a shared cache, so without one results are always computed. So are results read
+    from a replica, which may lag behind the version they would be cached under.
+    """
+    if not is_shared_cache() or reading_from_replica():
+        return compute()
+    key = f'analytics:{analytics_version()}:{name}:' + ':'.join(f'{key}={value}' for key, value in sorted(params.items()))
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, settings.ANALYTICS_CACHE_TTL)
+    return result
+
+
+def stock_value_by_supplier():
+    suppliers = models.Product.objects.filter(status=models.ACTIVE).values(
+        'supplier_id', supplier_name=F('supplier__name')
+    ).annotate(
+        product_count=Count('id'),
+        units_in_stock=Sum('stock_value'),
+        stock_value=Sum(STOCK_VALUE),
+    ).order_by('-stock_value')
+    suppliers = list(suppliers)
+    return {
+        'total_stock_value': sum(supplier['stock_value'] or 0 for supplier in suppliers),
+        'suppliers': suppliers,
+    }
+
+
+def movement_velocity(days, group_by='product', product_id=None):
+    since = timezone.now() - datetime.timedelta(days=days)
+    movements = models.StockMovement.objects.filter(date__gte=since)
+    if product_id:
+        movements = movements.filter(product_id=product_id)
+
+    totals = {
+        'total_increase': Coalesce(Sum('quantity', filter=Q(movement_type=models.StockMovement.INCREASE)), 0.0),
+        'total_decrease': Coalesce(Sum('quantity', filter=Q(movement_type=models.StockMovement.DECREASE)), 0.0),
+        'movement_count': Count('id'),
+    }
+    if group_by == 'day':
+        rows = movements.annotate(day=TruncDate('date')).values(
+            'day', 'product_id', product_name=F('product__name')
+        ).annotate(**totals).order_by('day', 'product_id')
+        return list(rows)
+
+    rows = movements.values(
+        'product_id', product_name=F('product__name'), stock_value=F('product__stock_value')
+    ).annotate(**totals).order_by('-total_decrease')
+    rows = list(rows)
+    for row in rows:
+        row['average_daily_decrease'] = row['total_decrease'] / days
+        row['days_of_stock_left'] = (
+            row['stock_value'] / row['average_daily_decrease'] if row['average_daily_decrease'] else None
+        )
+    return rows
+
+
+def top_products(limit, date_from=None, date_to=None):
+    lines = models.InvoiceProduct.objects.filter(
+        invoice__status=models.ACTIVE,
+        invoice__invoice_status__in=[models.Invoice.PAID, models.Invoice.DELIVERED],
+    )
+    if date_from:
+        lines = lines.filter(invoice__date_paid__date__gte=date_from)
+    if date_to:
+        lines = lines.filter(invoice__date_paid__date__lte=date_to)
+
+    rows = lines.values('product_id', product_name=F('product__name')).annotate(
+        quantity_sold=Sum('quantity'),
+        revenue=Sum('cost'),
+        invoice_count=Count('invoice', distinct=True),
+        rank=Window(Rank(), order_by=F('revenue').desc()),
+    ).order_by('rank', 'product_id')
+    return list(rows[:limit])
+
+
+def daily_sales(date_from=None, date_to=None, product_id=None):
+    rollups = models.DailySalesRollup.objects.all()
+    if date_from:
+        rollups = rollups.filter(day__gte=date_from)
+    if date_to:
+        rollups = rollups.filter(day__lte=date_to)
+    if product_id:
+        rows = rollups.filter(product_id=product_id).values(
+            'day', 'quantity_sold', 'revenue', 'invoice_count', 'quantity_delivered'
+        )
+    else:
+        rows = rollups.values('day').annotate(
+            quantity_sold=Sum('quantity_sold'),
+            revenue=Sum('revenue'),
+            invoice_count=Sum('invoice_count'),
+            quantity_delivered=Sum('quantity_delivered'),
+        )
+    return list(rows.order_by('day'))
@@ -0,0 +1,138 @@
+"""
+Async-native variants of the hottest read endpoints. Under the ASGI worker every DRF view runs behind a
+`sync_to_async` thread hop; these are plain Django coroutine views built on the async ORM instead. They answer the
+same anonymous GETs as their counterparts in `warehouse.views` and render the same camelCased JSON.
+"""
+import base64
+import binascii
+
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_safe
+from djangorestframework_camel_case.settings import api_settings as camel_case_settings
+from djangorestframework_camel_case.util import camelize
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
+
+from warehouse import caching, models, replicas, serializers, utils
+
+STOCK_MOVEMENT_PAGE_SIZE = 10
+STOCK_MOVEMENT_MAX_PAGE_SIZE = 100
+
+
+def render_json(data, status=200):
+    return JsonResponse(
+        camelize(data, **camel_case_settings.JSON_UNDERSCOREIZE),
+        encoder=JSONEncoder,
+        safe=False,
+        status=status,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+    )
+
+
+def render_error(exc):
+    # Same statuses and body as `core.exception_handler.custom_exception_handler`
+    status = 404 if isinstance(exc, (ObjectDoesNotExist, Http404)) else 400
+    return render_json({'detail': str(exc)}, status=status)
+
+
+def filter_queryset(filterset_class, request, queryset):
+    filterset = filterset_class(request.GET, queryset=queryset, request=request)
+    if not filterset.is_valid():
+        errors = {name: [str(error) for error in field_errors] for name, field_errors in filterset.errors.items()}
+        raise ValidationError(errors)
+    return filterset.qs
+
+
+def encode_cursor(movement):
+    return base64.urlsafe_b64encode(f'{movement.date.isoformat()}|{movement.pk}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        date, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        date, pk = parse_datetime(date), int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        date = None
+    if date is None:
+        raise ValueError('Invalid cursor')
+    return date, pk
+
+
+@require_safe
+async def product_list(request):
+    async def build_response():
+        try:
+            queryset = filter_queryset(
+                utils.ProductFilter,
+                request,
+                models.Product.objects.filter(status=models.ACTIVE).select_related('supplier'),
+            )
+        except ValidationError as exc:
+            return render_json({'detail': exc.message_dict}, status=400)
+        products = [product async for product in queryset]
+        return render_json(serializers.ProductSerializer(products, many=True, context={'request': request}).data)
+
+    return await caching.acached_response(request, [models.Product, models.Supplier], build_response)
+
+
+@require_safe
+async def product_detail(request, pk):
+    queryset = models.Product.objects.filter(status=models.ACTIVE).select_related('supplier')
+    try:
+        product = await queryset.aget(pk=pk)
+    except (models.Product.DoesNotExist, ValueError, ValidationError):
+        return render_error(Http404('No Product matches the given query.'))
+    return render_json(serializers.ProductSerializer(product, context={'request': request}).data)
+
+
+@require_safe
+async def retrieve_invoice(request, pk):
+    async def build_response():
+        queryset = models.Invoice.objects.filter(status=models.ACTIVE).prefetch_related(utils.invoice_products_prefetch())
+        try:
+            invoice = await queryset.aget(id=pk)
+        except (ObjectDoesNotExist, ValueError) as exc:
+            return render_error(exc)
+        return render_json(serializers.InvoiceSerializer(invoice).data)
+
+    return await caching.acached_response(request, [models.Invoice, models.InvoiceProduct, models.Product], build_response)
+
+
+@replicas.replica_reads
+@require_safe
+async def stock_movement_list(request):
+    """
+    Keyset pages over `(date, id)`, newest first, like `StockMovementCursorPagination`, and capped at the same page
+    size. Only forward `next` links are returned.
+    """
+    try:
+        page_size = int(request.GET.get('page_size', STOCK_MOVEMENT_PAGE_SIZE))
+        if page_size < 1:
+            raise ValueError('page_size must be a positive integer')
+        page_size = min(page_size, STOCK_MOVEMENT_MAX_PAGE_SIZE)
+        queryset = filter_queryset(
+            utils.StockMovementFilter,
+            request,
+            models.StockMovement.objects.select_related('product', 'user', 'invoice').order_by('-date', '-id'),
+        )
+        cursor = request.GET.get('cursor')
+        if cursor:
+            date, pk = decode_cursor(cursor)
+            queryset = queryset.filter(Q(date__lt=date) | Q(date=date, id__lt=pk))
+    except ValidationError as exc:
+        return render_json({'detail': exc.message_dict}, status=400)
+    except ValueError as exc:
+        return render_error(exc)
+
+    movements = [movement async for movement in queryset[:page_size + 1]]
+    next_url = None
+    if len(movements) > page_size:
+        movements = movements[:page_size]
+        next_url = replace_query_param(request.build_absolute_uri(), 'cursor', encode_cursor(movements[-1]))
+    return render_json({
+        'next': next_url,
+        'results': serializers.StockMovementSerializer(movements, many=True).data,
+    })
@@ -0,0 +1,100 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.fields.files import FieldFile
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from warehouse.caching import is_shared_cache
+from warehouse.models import User
+
+# Never cached, so a snapshot leaking from the cache holds no credentials
+SNAPSHOT_EXCLUDED_FIELDS = {'password'}
+
+
+class TokenCache:
+    """
+    Maps token keys to a snapshot of the token's user, in the Django cache named by TOKEN_AUTH_CACHE_ALIAS. The cache
+    must be shared by all workers so that invalidations reach every one of them; with a process-local cache nothing
+    is cached and `enabled` is False.
+    """
+
+    @property
+    def backend(self):
+        return caches[settings.TOKEN_AUTH_CACHE_ALIAS]
+
+    @property
+    def enabled(self):
+        return is_shared_cache(settings.TOKEN_AUTH_CACHE_ALIAS)
+
+    @staticmethod
+    def cache_key(key):
+        return f'auth-token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+    def get(self, key):
+        return self.backend.get(self.cache_key(key))
+
+    def set(self, key, snapshot):
+        self.backend.set(self.cache_key(key), snapshot, settings.TOKEN_AUTH_CACHE_TTL)
+
+    def delete(self, key):
+        if self.enabled:
+            self.backend.delete(self.cache_key(key))
+
+
+token_cache = TokenCache()
+
+
+def snapshot_user(user):
+    snapshot = {}
+    for field in user._meta.concrete_fields:
+        if field.attname in SNAPSHOT_EXCLUDED_FIELDS:
+            continue
+        value = getattr(user, field.attname)
+        snapshot[field.attname] = value.name if isinstance(value, FieldFile) else value
+    return snapshot
+
+
+def restore_user(snapshot):
+    # Fields left out of the snapshot are deferred and loaded from the database when accessed
+    return User.from_db(DEFAULT_DB_ALIAS, list(snapshot), list(snapshot.values()))
+
+
+def invalidate_tokens(keys):
+    """
+    Drops the cached entries of the token `keys` now and again once the current transaction commits, since a request
+    running in the meantime can cache the state that the transaction is about to replace
+    """
+    def delete():
+        for key in keys:
+            token_cache.delete(key)
+
+    delete()
+    transaction.on_commit(delete)
+
+
+def invalidate_user_tokens(user_id):
+    invalidate_tokens(list(Token.objects.filter(user_id=user_id).values_list('key', flat=True)))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that serves known tokens from `token_cache` instead of querying the token and user tables
+    on every request. Cached entries are dropped when the token is deleted or its user is saved. Behaves like
+    `TokenAuthentication` when no shared cache is configured.
+    """
+
+    def authenticate_credentials(self, key):
+        if not token_cache.enabled:
+            return super().authenticate_credentials(key)
+
+        snapshot = token_cache.get(key)
+        if snapshot is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, snapshot_user(user))
+            return user, token
+
+        user = restore_user(snapshot)
+        return user, Token(key=key, user=user)
@@ -0,0 +1,104 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def is_shared_cache(alias=DEFAULT_CACHE_ALIAS):
+    """
+    Whether the cache `alias` is seen by every worker process, which the process-local memory cache is not
+    """
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def model_version_key(model):
+    return f'model-version:{model._meta.label_lower}'
+
+
+def model_version(model):
+    """
+    Returns the current cache version of `model`, which expires after RESPONSE_CACHE_TTL seconds
+    """
+    return cache.get_or_set(model_version_key(model), new_version, settings.RESPONSE_CACHE_TTL)
+
+
+async def amodel_version(model):
+    return await cache.aget_or_set(model_version_key(model), new_version, settings.RESPONSE_CACHE_TTL)
+
+
+def bump_model_version(model):
+    cache.set(model_version_key(model), new_version(), settings.RESPONSE_CACHE_TTL)
+
+
+def response_etag(request, renderer_format, versions):
+    versions = ','.join(f'{model._meta.label_lower}={version}' for model, version in versions.items())
+    # Bodies hold absolute URLs (e.g. of images), so they differ per scheme and host
+    key = f'{request.build_absolute_uri(request.path)}?{request.GET.urlencode()}|{renderer_format}|{versions}'
+    return f'"{hashlib.md5(key.encode()).hexdigest()}"'
+
+
+def cached_response(request, models, build_response):
+    """
+    Serves a GET from the response cache, keyed on the request and the versions of the `models` the response is
+    built from. Replies 304 when the client's If-None-Match already holds the current ETag, and calls
+    `build_response` on a miss. Without a shared cache a version bump would only reach one worker, so nothing is
+    cached and no ETag is sent.
+    """
+    if request.method not in ('GET', 'HEAD') or not is_shared_cache():
+        return build_response()
+
+    versions = {model: model_version(model) for model in models}
+    etag = response_etag(request, request.accepted_renderer.format, versions)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    data = cache.get(f'response:{etag}')
+    if data is not None:
+        return Response(data, headers=headers)
+
+    response = build_response()
+    if response.status_code == status.HTTP_200_OK:
+        cache.set(f'response:{etag}', response.data, settings.RESPONSE_CACHE_TTL)
+        for header, value in headers.items():
+            response[header] = value
+    return response
+
+
+async def acached_response(request, models, build_response):
+    """
+    Async counterpart of `cached_response` for the plain Django views in `warehouse.async_views`. `build_response` is
+    a coroutine function returning a rendered JSON response, and the rendered body is what gets cached.
+    """
+    if request.method not in ('GET', 'HEAD') or not is_shared_cache():
+        return await build_response()
+
+    versions = {model: await amodel_version(model) for model in models}
+    etag = response_etag(request, 'json', versions)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return HttpResponseNotModified(headers=headers)
+
+    content = await cache.aget(f'response:{etag}')
+    if content is not None:
+        return HttpResponse(content, content_type='application/json', headers=headers)
+
+    response = await build_response()
+    if response.status_code == status.HTTP_200_OK:
+        await cache.aset(f'response:{etag}', response.content, settings.RESPONSE_CACHE_TTL)
+        for header, value in headers.items():
+            response[header] = value
+    return response
@@ -0,0 +1,146 @@
+import atexit
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+from versatileimagefield.utils import get_rendition_key_set, get_url_from_image_key
+
+logger = logging.getLogger(__name__)
+
+# The image field of each model whose renditions are pre-generated
+IMAGE_FIELDS = {'warehouse.user': 'avatar', 'warehouse.product': 'image'}
+RENDITION_KEY_SET = 'all_image_size'
+UPLOAD_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def normalize_image(file):
+    """
+    Returns the uploaded image `file` downscaled to fit IMAGE_UPLOAD_MAX_DIMENSION pixels and re-encoded as
+    IMAGE_UPLOAD_FORMAT, with its EXIF orientation applied
+    """
+    max_dimension = settings.IMAGE_UPLOAD_MAX_DIMENSION
+    image_format = settings.IMAGE_UPLOAD_FORMAT
+    file.seek(0)
+    with Image.open(file) as image:
+        if image.width * image.height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            raise ValueError(f'Images may have at most {settings.IMAGE_UPLOAD_MAX_PIXELS} pixels')
+        # Lets the JPEG decoder scale down while decoding
+        image.draft('RGB', (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        if has_alpha and image_format == 'WEBP':
+            image = image.convert('RGBA')
+        elif has_alpha:
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image.convert('RGBA'), mask=image.convert('RGBA').getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+
+        output = io.BytesIO()
+        image.save(output, image_format, quality=settings.IMAGE_UPLOAD_QUALITY)
+    return ContentFile(output.getvalue(), name=f'{Path(file.name).stem}.{UPLOAD_EXTENSIONS[image_format]}')
+
+
+class ImageProcessor:
+    """
+    Runs `normalize_image` in a pool of IMAGE_PROCESSING_WORKERS threads, which bounds how many uploads are decoded
+    and re-encoded at the same time no matter how many requests come in
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def process(self, file):
+        future = self._get_executor().submit(normalize_image, file)
+        try:
+            return future.result(timeout=settings.IMAGE_PROCESSING_TIMEOUT)
+        except TimeoutError:
+            future.cancel()
+            raise ValueError('The image could not be processed in time, try again later')
+
+    def _get_executor(self):
+        with self._lock:
+            # Threads do not survive a fork, so each worker process starts its own pool
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_PROCESSING_WORKERS, thread_name_prefix='image-processor'
+                )
+            return self._executor
+
+
+def warm_renditions(model_label, field_name, name):
+    """
+    Creates the `RENDITION_KEY_SET` renditions of the image `name` stored in `field_name` of `model_label`, skipping
+    the ones that already exist. Needs no database access, so it runs in worker threads and processes alike.
+    Returns the number of renditions warmed and the size keys that failed.
+    """
+    model = apps.get_model(model_label)
+    image = getattr(model(**{field_name: name}), field_name)
+    image.create_on_demand = True
+    warmed, failed = 0, []
+    for _, size_key in get_rendition_key_set(RENDITION_KEY_SET):
+        if size_key == 'url':
+            continue
+        try:
+            get_url_from_image_key(image, size_key)
+        except Exception:
+            logger.exception('Generating the %s rendition of %s failed', size_key, name)
+            failed.append(size_key)
+        else:
+            warmed += 1
+    return warmed, failed
+
+
+class RenditionWarmer:
+    """
+    Generates image renditions in a bounded pool of IMAGE_WARMER_WORKERS threads, off the request path. At most
+    IMAGE_WARMER_MAX_PENDING images wait at a time; further ones are skipped and rendered on demand instead.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._pending = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, model_label, field_name, name):
+        self._ensure_executor()
+        if not self._pending.acquire(blocking=False):
+            logger.warning('Rendition warmer is busy, leaving the renditions of %s to be created on demand', name)
+            return False
+        future = self._executor.submit(warm_renditions, model_label, field_name, name)
+        future.add_done_callback(lambda _: self._pending.release())
+        return True
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _ensure_executor(self):
+        with self._lock:
+            # Threads do not survive a fork, so each worker process starts its own pool
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pending = threading.BoundedSemaphore(settings.IMAGE_WARMER_MAX_PENDING)
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WARMER_WORKERS, thread_name_prefix='rendition-warmer'
+            )
+
+
+image_processor = ImageProcessor()
+rendition_warmer = RenditionWarmer()
+atexit.register(rendition_warmer.shutdown)
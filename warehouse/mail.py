@@ -0,0 +1,142 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+
+class MailQueue:
+    """
+    Bounded in-process queue of outbound emails. A single worker thread sends them in batches over one reused
+    connection, retrying the messages of a batch that were not sent with exponential backoff. The queue is drained when
+    the process exits.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._worker = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stats = {'enqueued': 0, 'sent': 0, 'failed': 0, 'retried': 0, 'dropped': 0}
+
+    def enqueue(self, message):
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self._count('dropped')
+            logger.warning('Mail queue is full, dropping email "%s" to %s', message.subject, message.to)
+            return False
+        self._count('enqueued')
+        return True
+
+    def drain(self, timeout=None):
+        """
+        Blocks until every queued email has been sent or given up on. Returns False if `timeout` elapsed first.
+        """
+        if self._queue is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=None):
+        self.drain(timeout)
+        self._stopping.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize() if self._queue is not None else 0
+        return stats
+
+    def _count(self, name, value=1):
+        with self._stats_lock:
+            self._stats[name] += value
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._pid == os.getpid() and self._worker.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Threads do not survive a fork, so each worker process starts its own, with a queue of its own
+                self._pid = os.getpid()
+                self._queue = queue.Queue(maxsize=settings.MAIL_QUEUE_MAX_SIZE)
+            else:
+                logger.warning('Mail queue worker stopped, restarting it with %s email(s) queued', self._queue.qsize())
+            self._stopping.clear()
+            self._worker = threading.Thread(target=self._run, name='mail-queue', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        connection = None
+        while not self._stopping.is_set():
+            try:
+                batch = [self._queue.get(timeout=settings.MAIL_QUEUE_IDLE_TIMEOUT)]
+            except queue.Empty:
+                # Do not hold an idle SMTP connection open
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                continue
+            while len(batch) < settings.MAIL_QUEUE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                connection = self._send(batch, connection)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        if connection is not None:
+            connection.close()
+
+    def _send(self, batch, connection):
+        """
+        Sends the batch one message at a time over `connection`, so that a failure only retries the messages not
+        accepted yet. Each message is retried MAIL_QUEUE_MAX_RETRIES times before it and the rest are given up on.
+        """
+        pending = list(batch)
+        attempt = 0
+        while pending:
+            try:
+                if connection is None:
+                    connection = get_connection()
+                    connection.open()
+                while pending:
+                    self._count('sent', connection.send_messages(pending[:1]) or 0)
+                    pending.pop(0)
+                    attempt = 0
+            except Exception as exc:
+                logger.warning('Sending %s email(s) failed (attempt %s): %s', len(pending), attempt + 1, exc)
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+                connection = None
+                if attempt >= settings.MAIL_QUEUE_MAX_RETRIES:
+                    self._count('failed', len(pending))
+                    break
+                self._count('retried')
+                time.sleep(settings.MAIL_QUEUE_RETRY_BACKOFF * 2 ** attempt)
+                attempt += 1
+        return connection
+
+mail_queue = MailQueue()
+atexit.register(mail_queue.shutdown, settings.MAIL_QUEUE_SHUTDOWN_TIMEOUT)
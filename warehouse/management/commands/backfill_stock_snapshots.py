@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from warehouse import models, utils
+
+SNAPSHOT_FIELDS = ['stock_value', 'total_increase', 'total_decrease', 'movement_count', 'last_movement']
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily stock snapshots from the stock movement history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Number of rows read and written per query')
+        parser.add_argument('--product', type=int, help='Only rebuild the snapshots of this product')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        product_ids = models.Product.objects.order_by('id').values_list('id', flat=True)
+        if options['product']:
+            product_ids = product_ids.filter(id=options['product'])
+
+        written = 0
+        for product_id in product_ids.iterator(chunk_size=chunk_size):
+            # Readers see either the old snapshots of a product or its rebuilt ones, never none
+            with transaction.atomic():
+                models.StockSnapshot.objects.filter(product_id=product_id).delete()
+                written += self.rebuild(product_id, chunk_size)
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} stock snapshots'))
+
+    def rebuild(self, product_id, chunk_size):
+        movements = models.StockMovement.objects.filter(product_id=product_id).only(
+            'id', 'product_id', 'date', 'quantity', 'movement_type', 'stock_after'
+        ).order_by('date', 'id')
+
+        # Movements are streamed in date order, so a day is complete as soon as the next one starts
+        written = 0
+        batch = []
+        day_movements = []
+        current_day = None
+        for movement in movements.iterator(chunk_size=chunk_size):
+            day = utils.local_day(movement.date)
+            if day != current_day and day_movements:
+                batch.extend(self.build_snapshots(day_movements))
+                day_movements = []
+            current_day = day
+            day_movements.append(movement)
+            if len(batch) >= chunk_size:
+                written += self.write(batch, chunk_size)
+                batch = []
+        batch.extend(self.build_snapshots(day_movements))
+        return written + self.write(batch, chunk_size)
+
+    @staticmethod
+    def build_snapshots(movements):
+        return [
+            models.StockSnapshot(product_id=product_id, day=day, **summary)
+            for (product_id, day), summary in utils.summarize_movements(movements).items()
+        ]
+
+    @staticmethod
+    def write(snapshots, chunk_size):
+        models.StockSnapshot.objects.bulk_create(
+            snapshots,
+            batch_size=chunk_size,
+            update_conflicts=True,
+            unique_fields=['product', 'day'],
+            update_fields=SNAPSHOT_FIELDS
+        )
+        return len(snapshots)
@@ -0,0 +1,73 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from warehouse import models
+
+# Models whose declared indexes serve the list filters and orderings
+INDEXED_MODELS = [models.Supplier, models.Product, models.Invoice, models.StockMovement]
+# Created by migration 0012 on Postgres only
+PRODUCT_NAME_TRIGRAM_INDEX = 'product_name_trgm_idx'
+
+
+def benchmark_queries():
+    """
+    Returns the queries the indexes are meant for, as (description, queryset) pairs
+    """
+    product_id = models.Product.objects.values_list('id', flat=True).first() or 0
+    supplier_id = models.Supplier.objects.values_list('id', flat=True).first() or 0
+    week_ago = timezone.now() - datetime.timedelta(days=7)
+    return [
+        ('Active suppliers', models.Supplier.objects.filter(status=models.ACTIVE).order_by('id')[:10]),
+        ('Active products', models.Product.objects.filter(status=models.ACTIVE).order_by('id')[:10]),
+        ('Active products of a supplier',
+         models.Product.objects.filter(status=models.ACTIVE, supplier_id=supplier_id).order_by('id')[:10]),
+        ('Product name search', models.Product.objects.filter(status=models.ACTIVE, name__icontains='sugar')[:10]),
+        ('Active invoices, newest first',
+         models.Invoice.objects.filter(status=models.ACTIVE).order_by('-created', '-id')[:10]),
+        ('Invoices paid this week', models.Invoice.objects.filter(date_paid__gte=week_ago)),
+        ('Stock movements of a product',
+         models.StockMovement.objects.filter(product_id=product_id).order_by('-date')[:10]),
+        ('Products changed since a sync',
+         models.Product.objects.filter(modified__gt=week_ago).order_by('modified', 'id')[:100]),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Prints the plan of each query the list filter indexes are meant for, with the indexes and then without '
+        'them. The indexes are dropped inside a transaction that is rolled back, which locks the tables meanwhile, '
+        'so run it against a copy of the production database rather than the database itself'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Run the queries and report their actual timings (EXPLAIN ANALYZE, Postgres only)'
+        )
+
+    def handle(self, *args, **options):
+        explain_options = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+
+        with transaction.atomic():
+            with_indexes = [(name, queryset.explain(**explain_options)) for name, queryset in benchmark_queries()]
+            self.drop_indexes()
+            without_indexes = [queryset.explain(**explain_options) for _, queryset in benchmark_queries()]
+            transaction.set_rollback(True)
+
+        for (name, indexed_plan), plan in zip(with_indexes, without_indexes):
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(self.style.SUCCESS('With indexes:'))
+            self.stdout.write(indexed_plan)
+            self.stdout.write(self.style.WARNING('Without indexes:'))
+            self.stdout.write(plan + '\n')
+
+    def drop_indexes(self):
+        names = [index.name for model in INDEXED_MODELS for index in model._meta.indexes]
+        if connection.vendor == 'postgresql':
+            names.append(PRODUCT_NAME_TRIGRAM_INDEX)
+        with connection.cursor() as cursor:
+            for name in names:
+                cursor.execute(f'DROP INDEX IF EXISTS {connection.ops.quote_name(name)}')
@@ -0,0 +1,105 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.urls import Resolver404, resolve
+
+
+def async_variant(path):
+    """
+    Returns the path of the async view serving the same data as `path`, or None when there is none
+    """
+    if not path.startswith('/warehouse/') or path.startswith('/warehouse/async/'):
+        return None
+    variant = '/warehouse/async/' + path.removeprefix('/warehouse/')
+    try:
+        resolve(variant.split('?')[0])
+    except Resolver404:
+        return None
+    return variant
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends concurrent GET requests to a running server and reports the throughput, the latency percentiles and '
+        'the database connections opened meanwhile. Run it with the settings of the server, before and after '
+        'changing DB_CONN_MAX_AGE or DB_POOL_MAX_SIZE, or with --compare-async to compare the sync and async views '
+        'under the same worker count'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help='URL of the server, e.g. http://localhost:8000')
+        parser.add_argument(
+            '--path', dest='paths', action='append',
+            help='Path to request, can be repeated. Defaults to /warehouse/products/'
+        )
+        parser.add_argument('--requests', type=int, default=1000, help='Number of requests sent to each path')
+        parser.add_argument('--concurrency', type=int, default=32, help='Number of requests in flight at a time')
+        parser.add_argument('--token', help='Key of the token to authenticate the requests with')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for each response')
+        parser.add_argument(
+            '--compare-async', action='store_true',
+            help='Also load the async variant of each path that has one, under /warehouse/async/'
+        )
+
+    def handle(self, *args, **options):
+        headers = {'Authorization': f'Token {options["token"]}'} if options['token'] else {}
+        paths = options['paths'] or ['/warehouse/products/']
+        if options['compare_async']:
+            paths = [variant for path in paths for variant in [path, async_variant(path)] if variant]
+        for path in paths:
+            url = options['base_url'].rstrip('/') + path
+            self.report(path, *self.measure(url, headers, options))
+
+    def measure(self, url, headers, options):
+        """
+        Returns the latencies of the successful requests to `url`, the number of failed ones, the seconds they all
+        took and the number of database connections opened meanwhile
+        """
+        def send(_):
+            request = urllib.request.Request(url, headers=headers)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=options['timeout']) as response:
+                    response.read()
+            except (urllib.error.URLError, TimeoutError):
+                return None
+            return time.perf_counter() - start
+
+        sessions = self.database_sessions()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(send, range(options['requests'])))
+        elapsed = time.perf_counter() - start
+        opened = self.database_sessions() - sessions if sessions is not None else None
+
+        latencies = [latency for latency in results if latency is not None]
+        return latencies, len(results) - len(latencies), elapsed, opened
+
+    def database_sessions(self):
+        """
+        Returns the number of sessions Postgres has established to the database so far, or None on other databases
+        """
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            # Statistics are read once per transaction otherwise
+            cursor.execute('SELECT pg_stat_clear_snapshot()')
+            cursor.execute('SELECT sessions FROM pg_stat_database WHERE datname = current_database()')
+            return cursor.fetchone()[0]
+
+    def report(self, path, latencies, failed, elapsed, opened):
+        if len(latencies) < 2:
+            self.stderr.write(f'{path}: {failed} of {failed + len(latencies)} requests failed')
+            return
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'{path}: {len(latencies) / elapsed:.1f} req/s, '
+            f'p50 {percentiles[49] * 1000:.1f} ms, p99 {percentiles[98] * 1000:.1f} ms, '
+            f'{failed} failed, '
+            + (f'{opened} database connections opened' if opened is not None else 'connections not measured')
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from warehouse import media, models
+
+
+class Command(BaseCommand):
+    help = 'Deletes the stored avatars and product images, with their renditions, that are no longer referenced'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-period', type=int, default=3600,
+            help='Seconds a file must have been unreferenced before it is deleted, which covers uploads in progress'
+        )
+        parser.add_argument(
+            '--recount', action='store_true', help='Recount the references from the stored avatars and images first'
+        )
+
+    def handle(self, *args, **options):
+        image_field = models.Product._meta.get_field('image')
+        if options['recount']:
+            media.recount([models.User._meta.get_field('avatar'), image_field])
+        deleted = media.prune(image_field, options['grace_period'])
+        for name in deleted:
+            self.stdout.write(f'Deleted {name}')
+        self.stdout.write(self.style.SUCCESS(f'Deleted {len(deleted)} unused media files'))
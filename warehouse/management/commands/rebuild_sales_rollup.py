@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+from warehouse import models
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily sales rollup from the paid and delivered invoices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Number of rows read and written per query')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        lines = models.InvoiceProduct.objects.filter(invoice__status=models.ACTIVE)
+        models.DailySalesRollup.objects.all().delete()
+
+        sales = lines.filter(invoice__date_paid__isnull=False).annotate(
+            day=TruncDate('invoice__date_paid')
+        ).values('day', 'product_id').annotate(
+            total_quantity=Sum('quantity'), total_revenue=Sum('cost'), total_invoices=Count('invoice', distinct=True)
+        ).order_by('day', 'product_id')
+        written = self.write((
+            models.DailySalesRollup(
+                day=row['day'],
+                product_id=row['product_id'],
+                quantity_sold=row['total_quantity'],
+                revenue=row['total_revenue'] or 0,
+                invoice_count=row['total_invoices'],
+            )
+            for row in sales.iterator(chunk_size=chunk_size)
+        ), chunk_size)
+
+        deliveries = lines.filter(invoice__date_supplied__isnull=False).annotate(
+            day=TruncDate('invoice__date_supplied')
+        ).values('day', 'product_id').annotate(total_quantity=Sum('quantity')).order_by('day', 'product_id')
+        written += self.write((
+            models.DailySalesRollup(day=row['day'], product_id=row['product_id'], quantity_delivered=row['total_quantity'])
+            for row in deliveries.iterator(chunk_size=chunk_size)
+        ), chunk_size, update_conflicts=True, unique_fields=['day', 'product'], update_fields=['quantity_delivered'])
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} sales rollup rows'))
+
+    @staticmethod
+    def write(rollups, chunk_size, **bulk_create_options):
+        # Delivery rows are merged into the rows already written for sales on the same day via update_conflicts
+        written = 0
+        batch = []
+        for rollup in rollups:
+            batch.append(rollup)
+            if len(batch) >= chunk_size:
+                models.DailySalesRollup.objects.bulk_create(batch, **bulk_create_options)
+                written += len(batch)
+                batch = []
+        if batch:
+            models.DailySalesRollup.objects.bulk_create(batch, **bulk_create_options)
+            written += len(batch)
+        return written
@@ -0,0 +1,45 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from warehouse import images
+
+
+class Command(BaseCommand):
+    help = 'Generates the missing renditions of every stored user avatar and product image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+        parser.add_argument('--model', choices=sorted(images.IMAGE_FIELDS), help='Only warm the images of this model')
+
+    def handle(self, *args, **options):
+        fields = images.IMAGE_FIELDS
+        if options['model']:
+            fields = {options['model']: fields[options['model']]}
+
+        # Workers set Django up again in case processes are spawned rather than forked
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            for model_label, field_name in fields.items():
+                names = list(
+                    apps.get_model(model_label).objects.exclude(**{f'{field_name}__isnull': True})
+                    .exclude(**{field_name: ''}).values_list(field_name, flat=True).distinct()
+                )
+                warmed = 0
+                failed = []
+                chunk_size = max(1, len(names) // (options['workers'] * 4))
+                results = executor.map(
+                    images.warm_renditions, repeat(model_label), repeat(field_name), names, chunksize=chunk_size
+                )
+                for name, (count, failed_keys) in zip(names, results):
+                    warmed += count
+                    failed.extend(f'{name} ({size_key})' for size_key in failed_keys)
+
+                self.stdout.write(self.style.SUCCESS(
+                    f'Warmed {warmed} renditions of {len(names)} {model_label} images'
+                ))
+                for failure in failed:
+                    self.stderr.write(f'Failed to create {failure}')
@@ -0,0 +1,131 @@
+import datetime
+import hashlib
+import os
+import tempfile
+from collections import Counter
+from pathlib import PurePosixPath
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+# Uploads are stored below this directory (see `models.path_and_filename`). Renditions live elsewhere and keep the
+# names versatileimagefield gives them.
+UPLOAD_ROOT = 'medias'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names each upload after the SHA-256 of its content, `medias/<ab>/<sha256>.<ext>`, so
+    identical uploads share one file and one rendition set. The hash is computed while the upload is copied to a
+    temporary file, which is dropped when the content is already stored. Files are reference counted in `MediaFile`
+    and deleted by `prune` once nothing uses them.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        if is_upload(name):
+            # The final name is only known once the content is hashed in `_save`
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if not is_upload(name):
+            return super()._save(name, content)
+
+        directory = self.path(UPLOAD_ROOT)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False) as temporary:
+            for chunk in content.chunks():
+                digest.update(chunk)
+                temporary.write(chunk)
+        hexdigest = digest.hexdigest()
+        name = f'{UPLOAD_ROOT}/{hexdigest[:2]}/{hexdigest}{PurePosixPath(name).suffix.lower()}'
+
+        # Registered before the existence check, so that `prune` cannot delete the file this upload is about to use
+        touch(name)
+        path = self.path(name)
+        if os.path.exists(path):
+            os.remove(temporary.name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temporary.name, path)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+        return name
+
+
+def is_upload(name):
+    return PurePosixPath(name).parts[:1] == (UPLOAD_ROOT,)
+
+
+def media_file_model():
+    return apps.get_model('warehouse', 'MediaFile')
+
+
+def touch(name):
+    """
+    Creates the `MediaFile` entry of `name` if needed and marks it as just used
+    """
+    MediaFile = media_file_model()
+    MediaFile.objects.bulk_create([MediaFile(name=name)], ignore_conflicts=True)
+    MediaFile.objects.filter(name=name).update(modified=timezone.now())
+
+
+def add_reference(name):
+    MediaFile = media_file_model()
+    MediaFile.objects.bulk_create([MediaFile(name=name)], ignore_conflicts=True)
+    MediaFile.objects.filter(name=name).update(references=F('references') + 1, modified=timezone.now())
+
+
+def release(name):
+    media_file_model().objects.filter(name=name, references__gt=0).update(
+        references=F('references') - 1, modified=timezone.now()
+    )
+
+
+def recount(image_fields):
+    """
+    Resets the reference counts from the values stored in `image_fields`, e.g. after rows were overwritten without
+    going through `save()`
+    """
+    MediaFile = media_file_model()
+    references = Counter()
+    for field in image_fields:
+        references.update(
+            field.model.objects.exclude(**{f'{field.name}__isnull': True}).exclude(**{field.name: ''})
+            .values_list(field.name, flat=True)
+        )
+    with transaction.atomic():
+        MediaFile.objects.exclude(name__in=references).update(references=0)
+        MediaFile.objects.bulk_create([MediaFile(name=name) for name in references], ignore_conflicts=True)
+        for name, count in references.items():
+            MediaFile.objects.filter(name=name).exclude(references=count).update(
+                references=count, modified=timezone.now()
+            )
+
+
+def prune(image_field, grace_period):
+    """
+    Deletes the files, and their renditions, that have not been referenced for `grace_period` seconds. `image_field`
+    is a VersatileImageField using the storage. Returns the names of the deleted files.
+    """
+    MediaFile = media_file_model()
+    cutoff = timezone.now() - datetime.timedelta(seconds=grace_period)
+    unused = MediaFile.objects.filter(references=0, modified__lt=cutoff)
+    deleted = []
+    for name in list(unused.values_list('name', flat=True)):
+        with transaction.atomic():
+            # The lock makes an upload of the same content wait in `touch` until the file is gone, after which it
+            # writes the file again
+            entry = unused.select_for_update().filter(name=name).first()
+            if entry is None:
+                continue
+            image = getattr(image_field.model(**{image_field.name: name}), image_field.name)
+            image.delete_all_created_images()
+            image_field.storage.delete(name)
+            entry.delete()
+        deleted.append(name)
+    return deleted
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:36
+
+from django.db import migrations, models
+
+INVOICE_NUMBER_SEQUENCE = 'warehouse_invoice_number_seq'
+
+
+def last_invoice_number(Invoice):
+    numbers = Invoice.objects.filter(invoice_number__isnull=False).values_list('invoice_number', flat=True)
+    return max((int(number.split('-')[-1]) for number in numbers), default=0)
+
+
+def seed_invoice_number_allocator(apps, schema_editor):
+    """Start the invoice number sequence/counter after the highest existing invoice number"""
+
+    Invoice = apps.get_model('warehouse', 'Invoice')
+    InvoiceNumberCounter = apps.get_model('warehouse', 'InvoiceNumberCounter')
+    last_number = last_invoice_number(Invoice)
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {INVOICE_NUMBER_SEQUENCE}')
+        if last_number:
+            schema_editor.execute('SELECT setval(%s, %s)', [INVOICE_NUMBER_SEQUENCE, last_number])
+    InvoiceNumberCounter.objects.update_or_create(name='invoice_number', defaults={'value': last_number})
+
+
+def drop_invoice_number_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {INVOICE_NUMBER_SEQUENCE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0007_remove_product_qr_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceNumberCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_invoice_number_allocator, drop_invoice_number_sequence),
+    ]
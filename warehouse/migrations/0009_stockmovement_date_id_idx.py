@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0008_invoicenumbercounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['date', 'id'], name='stockmovement_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:43
+
+import django.db.models.deletion
+import django_extensions.db.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0009_stockmovement_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('day', models.DateField()),
+                ('stock_value', models.FloatField()),
+                ('total_increase', models.FloatField(default=0)),
+                ('total_decrease', models.FloatField(default=0)),
+                ('movement_count', models.IntegerField(default=0)),
+                ('last_movement', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='warehouse.stockmovement')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_snapshots', to='warehouse.product')),
+            ],
+            options={
+                'get_latest_by': 'modified',
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(fields=('product', 'day'), name='stocksnapshot_product_day_unique')],
+            },
+        ),
+    ]
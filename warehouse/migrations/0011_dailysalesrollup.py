@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:46
+
+import django.db.models.deletion
+import django_extensions.db.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0010_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('day', models.DateField()),
+                ('quantity_sold', models.FloatField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('quantity_delivered', models.FloatField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='daily_sales', to='warehouse.product')),
+            ],
+            options={
+                'get_latest_by': 'modified',
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(fields=('day', 'product'), name='dailysalesrollup_day_product_unique')],
+            },
+        ),
+    ]
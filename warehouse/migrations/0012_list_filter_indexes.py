@@ -0,0 +1,54 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:47
+
+from django.db import migrations, models
+
+
+def create_product_name_trigram_index(apps, schema_editor):
+    """Index the expression `name__icontains` compiles to on Postgres, so it no longer scans the table"""
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS product_name_trgm_idx ON warehouse_product USING gin (UPPER("name"::text) gin_trgm_ops)'
+    )
+
+
+def drop_product_name_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS product_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0011_dailysalesrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_product_name_trigram_index, drop_product_name_trigram_index),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('status', 'Active')), fields=['created', 'id'], name='invoice_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['date_paid'], name='invoice_date_paid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('status', 'Active')), fields=['id'], name='product_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('status', 'Active')), fields=['supplier', 'id'], name='product_active_supplier_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'date'], name='stockmovement_product_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplier',
+            index=models.Index(condition=models.Q(('status', 'Active')), fields=['id'], name='supplier_active_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0012_list_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['modified', 'id'], name='invoice_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['modified', 'id'], name='product_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supplier',
+            index=models.Index(fields=['modified', 'id'], name='supplier_modified_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.3 on 2026-10-18 05:01
+
+from collections import Counter
+
+import django_extensions.db.fields
+import versatileimagefield.fields
+import warehouse.media
+import warehouse.models
+from django.db import migrations, models
+
+
+def count_media_references(apps, schema_editor):
+    MediaFile = apps.get_model('warehouse', 'MediaFile')
+    references = Counter()
+    for model_name, field_name in (('User', 'avatar'), ('Product', 'image')):
+        names = apps.get_model('warehouse', model_name).objects.exclude(**{f'{field_name}__isnull': True}).exclude(
+            **{field_name: ''}
+        ).values_list(field_name, flat=True)
+        references.update(names)
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=name, references=count) for name, count in references.items()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0013_sync_modified_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('references', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'get_latest_by': 'modified',
+                'abstract': False,
+            },
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=versatileimagefield.fields.VersatileImageField(blank=True, null=True, storage=warehouse.media.ContentAddressedStorage(), upload_to=warehouse.models.path_and_filename, verbose_name='product_image'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=versatileimagefield.fields.VersatileImageField(blank=True, null=True, storage=warehouse.media.ContentAddressedStorage(), upload_to=warehouse.models.path_and_filename, verbose_name='avatar'),
+        ),
+        migrations.RunPython(count_media_references, migrations.RunPython.noop),
+    ]
@@ -11,6 +11,7 @@ from django_extensions.db.models import TimeStampedModel
 from versatileimagefield.fields import VersatileImageField
 
 from warehouse import utils
+from warehouse.media import ContentAddressedStorage
 
 ACTIVE = 'Active'
 INACTIVE = 'Inactive'
@@ -63,7 +64,9 @@ class User(AbstractBaseUser, PermissionsMixin, TimeStampedModel):
     is_active = models.BooleanField(_("Is active"), default=True)
     is_staff = models.BooleanField(_("Is staff"), default=False)
     is_superuser = models.BooleanField(default=False)
-    avatar = VersatileImageField('avatar', null=True, blank=True, upload_to=path_and_filename)
+    avatar = VersatileImageField(
+        'avatar', null=True, blank=True, upload_to=path_and_filename, storage=ContentAddressedStorage()
+    )
 
     objects = UserManager()
 
@@ -73,6 +76,14 @@ class User(AbstractBaseUser, PermissionsMixin, TimeStampedModel):
     def __str__(self):
         return self.full_name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored avatar so that saves can update the media reference counts
+        if 'avatar' in field_names:
+            instance._stored_image_name = instance.__dict__['avatar'] or None
+        return instance
+
     def has_module_perms(self, app_label):
         """
         Does the user have permissions to view the app `app_label`?
@@ -100,6 +111,12 @@ class Supplier(TimeStampedModel):
     email = models.EmailField(unique=True)
     status = models.CharField(max_length=9, choices=ACTIVITY_CHOICES, default=ACTIVE)
 
+    class Meta(TimeStampedModel.Meta):
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(status=ACTIVE), name='supplier_active_idx'),
+            models.Index(fields=['modified', 'id'], name='supplier_modified_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -112,12 +129,37 @@ class Product(TimeStampedModel):
     unit_price = models.DecimalField(max_digits=12, decimal_places=2)
     stock_value = models.FloatField()
     # qr_code = models.CharField(max_length=100)
-    image = VersatileImageField('product_image', null=True, blank=True, upload_to=path_and_filename)
+    image = VersatileImageField(
+        'product_image', null=True, blank=True, upload_to=path_and_filename, storage=ContentAddressedStorage()
+    )
     status = models.CharField(max_length=9, choices=ACTIVITY_CHOICES, default=ACTIVE)
 
+    class Meta(TimeStampedModel.Meta):
+        # Product name search uses a trigram index, created on Postgres only (see migration 0012)
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(status=ACTIVE), name='product_active_idx'),
+            models.Index(fields=['supplier', 'id'], condition=models.Q(status=ACTIVE), name='product_active_supplier_idx'),
+            models.Index(fields=['modified', 'id'], name='product_modified_idx'),
+        ]
+
     def __str__(self):
         return f'{self.supplier.name}: {self.name}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded stock level so that saves can detect threshold crossings
+        if {'stock_value', 'threshold_value'}.issubset(field_names):
+            instance._was_low_on_stock = instance.is_low_on_stock
+        # Remember the stored image so that saves can update the media reference counts
+        if 'image' in field_names:
+            instance._stored_image_name = instance.__dict__['image'] or None
+        return instance
+
+    @property
+    def is_low_on_stock(self):
+        return self.stock_value <= self.threshold_value
+
 
 class InvoiceProduct(TimeStampedModel):
     product = models.ForeignKey(Product, related_name='invoice_products', on_delete=models.PROTECT)
@@ -147,6 +189,13 @@ class Invoice(TimeStampedModel):
     products = models.ManyToManyField(Product, through=InvoiceProduct)
     status = models.CharField(max_length=9, choices=ACTIVITY_CHOICES, default=ACTIVE)
 
+    class Meta(TimeStampedModel.Meta):
+        indexes = [
+            models.Index(fields=['created', 'id'], condition=models.Q(status=ACTIVE), name='invoice_active_created_idx'),
+            models.Index(fields=['date_paid'], name='invoice_date_paid_idx'),
+            models.Index(fields=['modified', 'id'], name='invoice_modified_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if self._state.adding:
             self.invoice_number = utils.generate_invoice_number()
@@ -156,6 +205,18 @@ class Invoice(TimeStampedModel):
         return self.invoice_number
 
 
+class InvoiceNumberCounter(models.Model):
+    """
+    Counter row used to allocate invoice numbers on databases without sequences (e.g. SQLite in tests).
+    On Postgres the `warehouse_invoice_number_seq` sequence is used instead.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
+
+
 class StockMovement(TimeStampedModel):
     INCREASE = 'Increase'
     DECREASE = 'Decrease'
@@ -169,9 +230,67 @@ class StockMovement(TimeStampedModel):
     stock_after = models.FloatField()
     user = models.ForeignKey(User, related_name='stock_movements', on_delete=models.PROTECT, null=True)
 
+    class Meta(TimeStampedModel.Meta):
+        indexes = [
+            models.Index(fields=['date', 'id'], name='stockmovement_date_id_idx'),
+            models.Index(fields=['product', 'date'], name='stockmovement_product_date_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if self.movement_type == self.INCREASE:
             self.stock_after = self.stock_before + self.quantity
         else:
             self.stock_after = self.stock_before - self.quantity
         super().save(*args, **kwargs)
+
+
+class StockSnapshot(TimeStampedModel):
+    """
+    Closing stock of a product for a day on which it moved, with that day's movement totals.
+    Maintained by `utils.update_stock_snapshots` and rebuilt by the `backfill_stock_snapshots` command.
+    """
+    product = models.ForeignKey(Product, related_name='stock_snapshots', on_delete=models.PROTECT)
+    day = models.DateField()
+    stock_value = models.FloatField()
+    total_increase = models.FloatField(default=0)
+    total_decrease = models.FloatField(default=0)
+    movement_count = models.IntegerField(default=0)
+    last_movement = models.ForeignKey(StockMovement, related_name='+', on_delete=models.PROTECT)
+
+    class Meta(TimeStampedModel.Meta):
+        constraints = [models.UniqueConstraint(fields=['product', 'day'], name='stocksnapshot_product_day_unique')]
+
+    def __str__(self):
+        return f'{self.product_id} on {self.day}: {self.stock_value}'
+
+
+class DailySalesRollup(TimeStampedModel):
+    """
+    Sales of a product on a day: what was paid for on that day and what was delivered on that day.
+    Maintained by `utils.record_invoice_sales`/`utils.record_invoice_delivery` and rebuilt by the
+    `rebuild_sales_rollup` command.
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, related_name='daily_sales', on_delete=models.PROTECT)
+    quantity_sold = models.FloatField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    invoice_count = models.IntegerField(default=0)
+    quantity_delivered = models.FloatField(default=0)
+
+    class Meta(TimeStampedModel.Meta):
+        constraints = [models.UniqueConstraint(fields=['day', 'product'], name='dailysalesrollup_day_product_unique')]
+
+    def __str__(self):
+        return f'{self.product_id} on {self.day}: {self.revenue}'
+
+
+class MediaFile(TimeStampedModel):
+    """
+    A file stored by `media.ContentAddressedStorage` and the number of user avatars and product images using it.
+    Unused files are deleted by the `prune_media_files` command.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
@@ -1,26 +1,46 @@
+from django.conf import settings
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
+from warehouse.utils import LRUCache
+
+# Role names per user id. Invalidated by the `m2m_changed` receiver on `User.groups`; entries held by other worker
+# processes expire after ROLE_CACHE_TTL seconds.
+role_cache = LRUCache(settings.ROLE_CACHE_MAX_SIZE, settings.ROLE_CACHE_TTL)
+
+
+def get_user_roles(user):
+    """
+    Returns the names of the groups the user belongs to. The result is memoized on the user object for the rest of
+    the request and in the process-wide role cache.
+    """
+    roles = getattr(user, '_warehouse_roles', None)
+    if roles is None:
+        roles = role_cache.get(user.pk)
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            role_cache.set(user.pk, roles)
+        user._warehouse_roles = roles
+    return roles
+
+
+def has_role(user, role):
+    return user.is_authenticated and role in get_user_roles(user)
+
 
 class IsWareHouseAdmin(BasePermission):
     def has_permission(self, request, view):
-        user = request.user
-        return request.method in SAFE_METHODS or user.is_authenticated and 'Admin' in user.groups.values_list('name', flat=True)
+        return request.method in SAFE_METHODS or has_role(request.user, 'Admin')
 
 
 class IsWareHouseManager(BasePermission):
     def has_permission(self, request, view):
-        user = request.user
-
-        return request.method in SAFE_METHODS or user.is_authenticated and 'Warehouse Manager' in user.groups.values_list('name', flat=True)
+        return request.method in SAFE_METHODS or has_role(request.user, 'Warehouse Manager')
 
 
 class IsSalesperson(BasePermission):
     def has_permission(self, request, view):
-        user = request.user
-        return request.method in SAFE_METHODS or user.is_authenticated and 'Salesperson' in user.groups.values_list('name', flat=True)
+        return request.method in SAFE_METHODS or has_role(request.user, 'Salesperson')
 
 class IsCashier(BasePermission):
     def has_permission(self, request, view):
-        user = request.user
-        return request.method in SAFE_METHODS or user.is_authenticated and 'Cashier' in user.groups.values_list(
-            'name', flat=True)
+        return request.method in SAFE_METHODS or has_role(request.user, 'Cashier')
@@ -0,0 +1,179 @@
+import contextvars
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.permissions import SAFE_METHODS
+
+REPLICA = 'replica'
+
+# The client making the current request, set by `replica_pinning_middleware`
+current_client = contextvars.ContextVar('replica_current_client', default=None)
+# True while a view wrapped in `replica_reads` serves a safe request
+replica_reads_enabled = contextvars.ContextVar('replica_reads_enabled', default=False)
+
+
+class Client:
+    def __init__(self, key):
+        self.key = key
+        self.pinned = False
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def client_key(request):
+    # Requests are told apart by their credentials, so pinning needs no authentication queries
+    credentials = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    return hashlib.sha256(credentials.encode()).hexdigest() if credentials else None
+
+
+def pin_key(client):
+    return f'replica-pin:{client.key}'
+
+
+def pin_client():
+    """
+    Sends the current client's reads to the primary for the next REPLICA_STICKY_WINDOW seconds, so it reads its own
+    writes even while the replica lags behind.
+    """
+    client = current_client.get()
+    if not replica_configured() or client is None or client.key is None or client.pinned:
+        return
+    client.pinned = True
+    cache.set(pin_key(client), True, settings.REPLICA_STICKY_WINDOW)
+
+
+@sync_and_async_middleware
+def replica_pinning_middleware(get_response):
+    """
+    Tracks the client of each request and pins it to the primary after a successful unsafe request. Writes made by
+    safe requests are pinned by the `post_save` and `post_delete` receivers.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = current_client.set(Client(client_key(request)))
+            try:
+                response = await get_response(request)
+                if request.method not in SAFE_METHODS and response.status_code < 400:
+                    pin_client()
+                return response
+            finally:
+                current_client.reset(token)
+    else:
+        def middleware(request):
+            token = current_client.set(Client(client_key(request)))
+            try:
+                response = get_response(request)
+                if request.method not in SAFE_METHODS and response.status_code < 400:
+                    pin_client()
+                return response
+            finally:
+                current_client.reset(token)
+    return middleware
+
+
+def use_replica(request):
+    if request.method not in SAFE_METHODS or not replica_configured():
+        return False
+    client = current_client.get()
+    if client is not None and client.key is not None and not client.pinned:
+        client.pinned = bool(cache.get(pin_key(client)))
+    return client is None or not client.pinned
+
+
+async def ause_replica(request):
+    if request.method not in SAFE_METHODS or not replica_configured():
+        return False
+    client = current_client.get()
+    if client is not None and client.key is not None and not client.pinned:
+        client.pinned = bool(await cache.aget(pin_key(client)))
+    return client is None or not client.pinned
+
+
+def read_from_replica(content):
+    # Streamed rows are fetched after the view has returned
+    token = replica_reads_enabled.set(True)
+    try:
+        yield from content
+    finally:
+        replica_reads_enabled.reset(token)
+
+
+async def aread_from_replica(content):
+    token = replica_reads_enabled.set(True)
+    try:
+        async for chunk in content:
+            yield chunk
+    finally:
+        replica_reads_enabled.reset(token)
+
+
+def replica_reads(view):
+    """
+    Serves safe requests to `view` from the read replica, when one is configured and the client has not written
+    recently. Meant for list, report and export views.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if not await ause_replica(request):
+                return await view(request, *args, **kwargs)
+            token = replica_reads_enabled.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                replica_reads_enabled.reset(token)
+        return wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not use_replica(request):
+            return view(request, *args, **kwargs)
+        token = replica_reads_enabled.set(True)
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            replica_reads_enabled.reset(token)
+        if isinstance(response, StreamingHttpResponse):
+            read = aread_from_replica if response.is_async else read_from_replica
+            response.streaming_content = read(response.streaming_content)
+        return response
+    return wrapper
+
+
+def reading_from_replica():
+    """
+    Whether reads of the warehouse data models currently go to the replica
+    """
+    client = current_client.get()
+    return replica_reads_enabled.get() and (client is None or not client.pinned)
+
+
+class ReplicaRouter:
+    """
+    Routes reads of the warehouse data models to the `replica` database inside `replica_reads` views. Users, tokens,
+    sessions and groups are always read from the primary, so authentication never sees replication lag.
+    """
+    primary_only_models = {'warehouse.user', 'warehouse.passwordresettoken', 'warehouse.invoicenumbercounter'}
+
+    def db_for_read(self, model, **hints):
+        if (
+            reading_from_replica()
+            and model._meta.app_label == 'warehouse'
+            and model._meta.label_lower not in self.primary_only_models
+        ):
+            return REPLICA
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
@@ -0,0 +1,141 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Upper
+
+from warehouse import models
+
+# Score bonus for names starting with the query, so that autocomplete matches come first
+PREFIX_BONUS = 1.0
+
+
+def ngrams(text, n=3):
+    text = f'  {text.lower()} '
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def similarity(grams, other_grams):
+    shared = len(grams & other_grams)
+    return shared / (len(grams) + len(other_grams) - shared)
+
+
+class ProductSearchBackend(ABC):
+    """
+    Finds active products whose name matches a query, best match first. Subclasses implement `search`, returning a
+    list of `(product_id, score)`.
+    """
+
+    @abstractmethod
+    def search(self, query, limit):
+        ...
+
+    def products(self, query, limit):
+        results = self.search(query, limit)
+        products = models.Product.objects.select_related('supplier').in_bulk([product_id for product_id, _ in results])
+        return [(products[product_id], score) for product_id, score in results if product_id in products]
+
+
+class PostgresProductSearch(ProductSearchBackend):
+    """
+    Uses pg_trgm word similarity (typo tolerant, served by the `product_name_trgm_idx` index) together with full
+    text ranking over the product and supplier names.
+    """
+
+    def search(self, query, limit):
+        products = models.Product.objects.filter(status=models.ACTIVE).annotate(search_name=Upper('name')).filter(
+            Q(search_name__trigram_word_similar=query.upper()) | Q(search_name__startswith=query.upper())
+        ).annotate(
+            score=TrigramWordSimilarity(query, 'name')
+            + SearchRank(SearchVector('name', 'supplier__name'), SearchQuery(query, search_type='websearch'))
+            + Case(When(search_name__startswith=query.upper(), then=Value(PREFIX_BONUS)), default=Value(0.0), output_field=FloatField())
+        ).order_by(F('score').desc(), 'name')
+        return list(products.values_list('id', 'score')[:limit])
+
+
+class NgramProductSearch(ProductSearchBackend):
+    """
+    In-process trigram index over the active product names, for databases without pg_trgm (e.g. SQLite).
+    Kept current by the Product signals in this process and rebuilt every PRODUCT_SEARCH_INDEX_TTL seconds to pick up
+    changes made by other workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = None
+        self._postings = {}
+        self._built_at = 0
+
+    def search(self, query, limit):
+        self._ensure_index()
+        query = query.lower()
+        query_grams = ngrams(query)
+        with self._lock:
+            shared = Counter(product_id for gram in query_grams for product_id in self._postings.get(gram, ()))
+            names = {product_id: self._names[product_id] for product_id in shared}
+
+        results = []
+        for product_id in shared:
+            name = names[product_id]
+            # Compare with the best matching word as well, so that a query is not diluted by a long name
+            score = max(similarity(query_grams, ngrams(part)) for part in [name, *name.split()])
+            is_prefix = name.startswith(query) or any(word.startswith(query) for word in name.split())
+            if score >= settings.PRODUCT_SEARCH_MIN_SIMILARITY or is_prefix:
+                results.append((product_id, score + (PREFIX_BONUS if is_prefix else 0.0), name))
+        results.sort(key=lambda result: (-result[1], result[2]))
+        return [(product_id, score) for product_id, score, _ in results[:limit]]
+
+    def update(self, product):
+        with self._lock:
+            if self._names is None:
+                return
+            self._remove(product.id)
+            if product.status == models.ACTIVE:
+                self._add(product.id, product.name)
+
+    def remove(self, product_id):
+        with self._lock:
+            if self._names is not None:
+                self._remove(product_id)
+
+    def _ensure_index(self):
+        with self._lock:
+            if self._names is not None and time.monotonic() - self._built_at < settings.PRODUCT_SEARCH_INDEX_TTL:
+                return
+            self._names = {}
+            self._postings = {}
+            for product_id, name in models.Product.objects.filter(status=models.ACTIVE).values_list('id', 'name').iterator():
+                self._add(product_id, name)
+            self._built_at = time.monotonic()
+
+    def _add(self, product_id, name):
+        self._names[product_id] = name.lower()
+        for gram in ngrams(name):
+            self._postings.setdefault(gram, set()).add(product_id)
+
+    def _remove(self, product_id):
+        name = self._names.pop(product_id, None)
+        if name is None:
+            return
+        for gram in ngrams(name):
+            self._postings[gram].discard(product_id)
+
+
+ngram_product_search = NgramProductSearch()
+
+
+def get_product_search_backend():
+    backend = settings.PRODUCT_SEARCH_BACKEND or ('postgres' if connection.vendor == 'postgresql' else 'ngram')
+    if backend == 'postgres':
+        return PostgresProductSearch()
+    return ngram_product_search
@@ -1,15 +1,39 @@
-import datetime
-
 from django.contrib.auth.models import Group
 from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from PIL import Image
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import ValidationError
 from versatileimagefield.serializers import VersatileImageFieldSerializer
 
 from . import models as all_models
+from .images import image_processor
 from .models import User
-from .utils import create_product_movement, update_stock
+from .permissions import role_cache
+from .utils import (
+    InsufficientStock,
+    add_invoice_products,
+    apply_stock_changes,
+    create_product_movement,
+    invoice_products_prefetch,
+    record_invoice_sales,
+    update_stock,
+)
+
+
+class ImageUploadField(serializers.ImageField):
+    """
+    Image upload that is stored downscaled and re-encoded (see `images.normalize_image`)
+    """
+
+    def to_internal_value(self, data):
+        image = super().to_internal_value(data)
+        try:
+            return image_processor.process(image)
+        except (OSError, ValueError, Image.DecompressionBombError) as exc:
+            raise ValidationError(str(exc))
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -41,7 +65,7 @@ class RegisterSerializer(serializers.Serializer):
     last_name = serializers.CharField()
     password = serializers.CharField()
     confirm_password = serializers.CharField()
-    avatar_file = serializers.FileField(required=False, write_only=True)
+    avatar_file = ImageUploadField(required=False, write_only=True)
 
     class Meta:
         fields = UserSerializer.Meta.fields
@@ -115,10 +139,11 @@ class PasswordChangeSerializer(serializers.Serializer):
         password = self.validated_data.get('password')
         old_password = self.validated_data.get('old_password')
         request = self.context.get('request')
-        user = request.user
+        # request.user may come from the token cache, so only the password is written, on a fresh copy
+        user = User.objects.get(pk=request.user.pk)
         if user.check_password(old_password):
             user.set_password(password)
-            user.save()
+            user.save(update_fields=['password', 'modified'])
         else:
             raise ValueError('Old password is incorrect')
 
@@ -134,11 +159,12 @@ class ManageUserSerializer(serializers.Serializer):
         user_id = self.validated_data.get('user_id')
 
         user = User.objects.get(id=user_id)
-        if is_active:
+        if is_active is not None:
             user.is_active = is_active
         if roles is not None:
             groups = Group.objects.filter(name__in=roles)
             user.groups.set(groups)
+            role_cache.delete(user.id)
         user.save()
 
 
@@ -150,6 +176,7 @@ class SupplierSerializer(serializers.ModelSerializer):
 
 
 class ProductSerializer(serializers.ModelSerializer):
+    image = ImageUploadField(required=False, allow_null=True)
 
     class Meta:
         model = all_models.Product
@@ -174,8 +201,7 @@ class ProductSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        supplier_id = data.pop('supplier')
-        data['supplier'] = all_models.Supplier.objects.get(id=supplier_id).name
+        data['supplier'] = instance.supplier.name
         return data
 
 
@@ -213,7 +239,7 @@ class StockMovementSerializer(serializers.ModelSerializer):
         data = super().to_representation(instance)
         data['date'] = instance.date.date() if instance.date else None
         data['product'] = instance.product.name
-        data['user'] = instance.user.full_name
+        data['user'] = instance.user.full_name if instance.user else None
         return data
 
 
@@ -243,7 +269,18 @@ class InvoiceSerializer(serializers.ModelSerializer):
         return data
 
     def get_products(self, instance):
-        return instance.invoice_products.values('id', 'product', 'quantity', 'cost', 'product__name')
+        # No-op when the invoices were already fetched with `invoice_products_prefetch`
+        prefetch_related_objects([instance], invoice_products_prefetch())
+        return [
+            {
+                'id': invoice_product.id,
+                'product': invoice_product.product_id,
+                'quantity': invoice_product.quantity,
+                'cost': invoice_product.cost,
+                'product__name': invoice_product.product.name
+            }
+            for invoice_product in instance.invoice_products.all()
+        ]
 
 
 class ItemSerializer(serializers.Serializer):
@@ -257,14 +294,17 @@ class InvoiceCreateSerializer(serializers.Serializer):
     customer_contact = serializers.CharField()
     invoice_status = serializers.ChoiceField(choices=['Pending', 'Paid'], default='Pending')
 
+    @transaction.atomic
     def save(self):
         data = self.validated_data
         products = data.pop('products', [])
         if data.get('invoice_status') == 'Paid':
-            data['date_paid'] = datetime.datetime.now()
+            data['date_paid'] = timezone.now()
         invoice = all_models.Invoice.objects.create(**data)
-        for item in products:
-            all_models.InvoiceProduct.objects.create(**item, invoice=invoice)
+        if products:
+            add_invoice_products(invoice, products)
+        if invoice.invoice_status == all_models.Invoice.PAID:
+            record_invoice_sales(invoice)
         return invoice
 
 
@@ -277,12 +317,14 @@ class InvoiceUpdateSerializer(serializers.Serializer):
     def save(self):
         pk = self.context.get('pk')
         data = self.validated_data
-        instance = all_models.Invoice.objects.filter(status=all_models.ACTIVE).get(id=pk)
+        # Locked so that a concurrent payment cannot record the lines that are about to be replaced
+        instance = all_models.Invoice.objects.select_for_update().filter(status=all_models.ACTIVE).get(id=pk)
+        if instance.invoice_status != all_models.Invoice.PENDING:
+            raise ValueError('You can only update an invoice before payment')
         products = data.pop('products', [])
         if products:
             instance.invoice_products.all().delete()
-            for item in products:
-                all_models.InvoiceProduct.objects.create(**item, invoice=instance)
+            add_invoice_products(instance, products)
         for key, val in data.items():
             setattr(instance, key, val)
         instance.save()
@@ -308,3 +350,100 @@ class StockUpdateSerializer(serializers.Serializer):
         product = self.context.get('product')
         updated_product = update_stock(product, self.validated_data.get('change_type'), self.validated_data.get('quantity'), request.user)
         return updated_product
+
+
+class StockUpdateItemSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+    change_type = serializers.ChoiceField(choices=[all_models.StockMovement.INCREASE, all_models.StockMovement.DECREASE])
+
+
+class BulkStockUpdateSerializer(serializers.Serializer):
+    items = serializers.ListField(child=StockUpdateItemSerializer(), allow_empty=False)
+
+    def validate_items(self, items):
+        product_ids = {item['product_id'] for item in items}
+        active_ids = set(
+            all_models.Product.objects.filter(id__in=product_ids, status=all_models.ACTIVE).values_list('id', flat=True)
+        )
+        errors = {
+            index: {'product_id': [f'Product {item["product_id"]} does not exist or is not active']}
+            for index, item in enumerate(items) if item['product_id'] not in active_ids
+        }
+        if errors:
+            raise ValidationError(errors)
+        return items
+
+    def save(self):
+        request = self.context.get('request')
+        try:
+            movements = apply_stock_changes(self.validated_data['items'], request.user)
+        except InsufficientStock as exc:
+            raise ValidationError({'items': {exc.index: {
+                'quantity': [f'Insufficient stock for product {exc.product_id}']
+            }}})
+        return [
+            {
+                'product_id': movement.product_id,
+                'product': movement.product.name,
+                'change_type': movement.movement_type,
+                'quantity': movement.quantity,
+                'stock_before': movement.stock_before,
+                'stock_after': movement.stock_after
+            }
+            for movement in movements
+        ]
+
+
+class MovementVelocityQuerySerializer(serializers.Serializer):
+    days = serializers.IntegerField(min_value=1, max_value=365, default=30)
+    group_by = serializers.ChoiceField(choices=['product', 'day'], default='product')
+    product = serializers.IntegerField(required=False)
+
+
+class TopProductsQuerySerializer(serializers.Serializer):
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+
+class DailySalesQuerySerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    product = serializers.IntegerField(required=False)
+
+
+class StockLevelQuerySerializer(serializers.Serializer):
+    at = serializers.DateTimeField()
+
+
+class ProductSearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=255)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    autocomplete = serializers.BooleanField(default=False)
+
+
+class SyncSerializerMixin:
+    """
+    Adds `modified` to the representation and reduces inactive (soft-deleted) objects to a tombstone
+    """
+    def to_representation(self, instance):
+        modified = serializers.DateTimeField().to_representation(instance.modified)
+        if instance.status == all_models.INACTIVE:
+            return {'id': instance.id, 'status': instance.status, 'modified': modified}
+        data = super().to_representation(instance)
+        data['status'] = instance.status
+        data['modified'] = modified
+        return data
+
+
+class SupplierSyncSerializer(SyncSerializerMixin, SupplierSerializer):
+    pass
+
+
+class ProductSyncSerializer(SyncSerializerMixin, ProductSerializer):
+    pass
+
+
+class InvoiceSyncSerializer(SyncSerializerMixin, InvoiceSerializer):
+    pass
@@ -1,12 +1,147 @@
-from django.db.models.signals import post_save
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
 
-from warehouse.models import Product, User
-from warehouse.utils import send_threshold_alert
+from warehouse import media
+from warehouse.analytics import invalidate_analytics
+from warehouse.authentication import invalidate_tokens, invalidate_user_tokens
+from warehouse.caching import bump_model_version
+from warehouse.images import IMAGE_FIELDS, rendition_warmer
+from warehouse.models import (
+    DailySalesRollup,
+    Invoice,
+    InvoiceProduct,
+    Product,
+    StockMovement,
+    Supplier,
+    User,
+)
+from warehouse.permissions import role_cache
+from warehouse.replicas import pin_client
+from warehouse.search import ngram_product_search
+from warehouse.utils import low_stock_digest
 
 
 @receiver(post_save, sender=Product)
 def send_threshold_notification(sender, instance, **kwargs):
-    if instance.stock_value <= instance.threshold_value:
-        managers = User.objects.filter(groups__name='Warehouse Manager')
-        send_threshold_alert(instance, managers)
+    was_low_on_stock = getattr(instance, '_was_low_on_stock', False)
+    instance._was_low_on_stock = instance.is_low_on_stock
+    if instance.is_low_on_stock and not was_low_on_stock:
+        transaction.on_commit(lambda: low_stock_digest.add(instance.pk))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        role_cache.delete(instance.pk)
+    elif pk_set:
+        for user_id in pk_set:
+            role_cache.delete(user_id)
+    else:
+        # A group was cleared of all its users
+        role_cache.clear()
+
+
+@receiver([post_save, post_delete], sender=Group)
+def invalidate_all_roles(sender, **kwargs):
+    role_cache.clear()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def invalidate_saved_user_tokens(sender, instance, created, **kwargs):
+    # Covers password changes/resets and activation changes, which all save the user
+    if not created:
+        invalidate_user_tokens(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Invoice)
+@receiver([post_save, post_delete], sender=InvoiceProduct)
+@receiver([post_save, post_delete], sender=StockMovement)
+@receiver([post_save, post_delete], sender=DailySalesRollup)
+def invalidate_analytics_cache(sender, **kwargs):
+    # Movements written by `apply_stock_changes` are covered by the post_save it sends for their products
+    transaction.on_commit(invalidate_analytics)
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, **kwargs):
+    # Only committed changes reach the index, so a rolled back save leaves no phantom entry behind
+    transaction.on_commit(lambda: ngram_product_search.update(instance))
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_product_search_index(sender, instance, **kwargs):
+    # The deletion clears `instance.pk` before the transaction commits
+    product_id = instance.pk
+    transaction.on_commit(lambda: ngram_product_search.remove(product_id))
+
+
+@receiver([post_save, post_delete], sender=Supplier)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Invoice)
+@receiver([post_save, post_delete], sender=InvoiceProduct)
+@receiver([post_save, post_delete], sender=Group)
+def invalidate_cached_responses(sender, **kwargs):
+    transaction.on_commit(lambda: bump_model_version(sender))
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Product)
+def detect_image_upload(sender, instance, **kwargs):
+    # A newly assigned file is only committed to storage by the save that follows
+    image = getattr(instance, IMAGE_FIELDS[sender._meta.label_lower])
+    instance._uploaded_image = bool(image) and not image._committed
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Product)
+def warm_image_renditions(sender, instance, **kwargs):
+    if not getattr(instance, '_uploaded_image', False):
+        return
+    instance._uploaded_image = False
+    field_name = IMAGE_FIELDS[sender._meta.label_lower]
+    name = getattr(instance, field_name).name
+    transaction.on_commit(lambda: rendition_warmer.submit(sender._meta.label_lower, field_name, name))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Product)
+def count_image_references(sender, instance, created, update_fields, **kwargs):
+    field_name = IMAGE_FIELDS[sender._meta.label_lower]
+    if update_fields is not None and field_name not in update_fields:
+        return
+    if not created and not hasattr(instance, '_stored_image_name'):
+        # Loaded without the image field, so the previous value is unknown
+        return
+    stored = getattr(instance, '_stored_image_name', None)
+    current = getattr(instance, field_name).name or None
+    if current == stored:
+        return
+    if current:
+        media.add_reference(current)
+    if stored:
+        media.release(stored)
+    instance._stored_image_name = current
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Product)
+def release_image_reference(sender, instance, **kwargs):
+    name = getattr(instance, '_stored_image_name', None)
+    if name:
+        media.release(name)
+
+
+@receiver([post_save, post_delete, m2m_changed])
+def pin_writing_client(sender, **kwargs):
+    pin_client()
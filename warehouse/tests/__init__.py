@@ -0,0 +1,3 @@
+"""
+Run with `python manage.py test --settings=core.test_settings`
+"""
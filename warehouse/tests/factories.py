@@ -0,0 +1,54 @@
+import datetime
+
+from django.contrib.auth.models import Group
+from rest_framework.authtoken.models import Token
+
+from warehouse import models
+
+
+def create_user(email, role=None):
+    """
+    Returns a user with the given `role` and the key of its token
+    """
+    user = models.User.objects.create_user(email, 'password', phone_number=email)
+    if role:
+        user.groups.add(Group.objects.get_or_create(name=role)[0])
+    return user, Token.objects.create(user=user).key
+
+
+def create_supplier(name='Supplier'):
+    return models.Supplier.objects.create(name=name, email=f'{name.lower()}@example.com', phone_number=name)
+
+
+def create_products(count, supplier=None, stock_value=100):
+    supplier = supplier or create_supplier()
+    return [
+        models.Product.objects.create(
+            name=f'Product {index}', supplier=supplier, product_unit='kg', threshold_value=0,
+            unit_price=10, stock_value=stock_value
+        )
+        for index in range(count)
+    ]
+
+
+def create_movements(product, count):
+    date = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    return models.StockMovement.objects.bulk_create([
+        models.StockMovement(
+            date=date + datetime.timedelta(hours=index), product=product, quantity=1,
+            movement_type=models.StockMovement.INCREASE, stock_before=index, stock_after=index + 1
+        )
+        for index in range(count)
+    ])
+
+
+def create_invoices(products, count):
+    invoices = []
+    for index in range(count):
+        invoice = models.Invoice.objects.create(customer_name=f'Customer {index}', customer_contact='0800')
+        models.InvoiceProduct.objects.bulk_create([
+            models.InvoiceProduct(invoice=invoice, product=product, quantity=1, cost=product.unit_price)
+            for product in products
+        ])
+        invoices.append(invoice)
+    return invoices
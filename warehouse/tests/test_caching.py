@@ -0,0 +1,34 @@
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from warehouse.tests.factories import create_products
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        # Responses are only cached with a cache shared by all workers, which a file based cache is
+        shared_cache = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.cache_dir.name,
+        }})
+        shared_cache.enable()
+        self.addCleanup(shared_cache.disable)
+        create_products(2)
+
+    def get(self, host, secure=False, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.client.get('/warehouse/products/', headers=headers, HTTP_HOST=host, secure=secure)
+
+    def test_etag_is_reused_on_the_same_host(self):
+        etag = self.get('a.example.com')['ETag']
+        self.assertEqual(self.get('a.example.com', etag=etag).status_code, 304)
+
+    def test_responses_are_cached_per_host_and_scheme(self):
+        etag = self.get('a.example.com')['ETag']
+        for host, secure in [('b.example.com', False), ('a.example.com', True)]:
+            with self.subTest(host=host, secure=secure):
+                response = self.get(host, secure, etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
@@ -0,0 +1,44 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from warehouse import models, views
+from warehouse.tests.factories import create_invoices, create_products, create_user
+
+
+class SupplyInvoiceTests(TestCase):
+    def setUp(self):
+        self.products = create_products(2, stock_value=5)
+        self.invoice = create_invoices(self.products, 1)[0]
+        self.invoice.invoice_status = models.Invoice.PAID
+        self.invoice.save()
+        self.user, self.token = create_user('sales@example.com', 'Salesperson')
+
+    def supply(self):
+        return self.client.get(
+            f'/warehouse/invoices-supplied/{self.invoice.pk}/', headers={'Authorization': f'Token {self.token}'}
+        )
+
+    def assertNothingWritten(self):
+        self.assertEqual(list(models.Product.objects.values_list('stock_value', flat=True)), [5, 5])
+        self.assertFalse(models.StockMovement.objects.exists())
+        self.assertFalse(models.StockSnapshot.objects.exists())
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.invoice_status, models.Invoice.PAID)
+
+    def test_supply(self):
+        self.assertEqual(self.supply().status_code, 200)
+        self.assertEqual(list(models.Product.objects.values_list('stock_value', flat=True)), [4, 4])
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.invoice_status, models.Invoice.DELIVERED)
+
+    def test_failure_after_taking_items_out_of_stock_writes_nothing(self):
+        with mock.patch('warehouse.utils.record_invoice_delivery', side_effect=RuntimeError('Rollup unavailable')):
+            self.assertEqual(self.supply().status_code, 400)
+        self.assertNothingWritten()
+
+    def test_supply_invoice_items_is_atomic(self):
+        with mock.patch('warehouse.utils.update_stock_snapshots', side_effect=RuntimeError('Snapshots unavailable')):
+            with self.assertRaises(RuntimeError):
+                views.supply_invoice_items(self.invoice, self.user)
+        self.assertNothingWritten()
@@ -0,0 +1,107 @@
+import threading
+from unittest import mock
+
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import SimpleTestCase, override_settings
+
+from warehouse import mail as mail_module
+from warehouse.mail import MailQueue
+
+
+class FlakyBackend(EmailBackend):
+    """
+    Locmem backend failing once on each subject listed in `failures`, after sending the messages before it
+    """
+    failures = set()
+
+    def send_messages(self, messages):
+        sent = 0
+        for message in messages:
+            if message.subject in self.failures:
+                self.failures.discard(message.subject)
+                raise ConnectionError(f'Could not send {message.subject}')
+            sent += super().send_messages([message])
+        return sent
+
+
+class BlockingBackend(EmailBackend):
+    """
+    Locmem backend that waits for `release` before sending, after setting `sending`
+    """
+    sending = threading.Event()
+    release = threading.Event()
+
+    def send_messages(self, messages):
+        self.sending.set()
+        self.release.wait(5)
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    MAIL_QUEUE_BATCH_SIZE=3,
+    MAIL_QUEUE_MAX_RETRIES=2,
+    MAIL_QUEUE_RETRY_BACKOFF=0,
+    MAIL_QUEUE_IDLE_TIMEOUT=0.05,
+)
+class MailQueueTests(SimpleTestCase):
+    def setUp(self):
+        mail.outbox = []
+        self.queue = MailQueue()
+        self.addCleanup(self.queue.shutdown, 5)
+
+    def send(self, *subjects):
+        for subject in subjects:
+            self.queue.enqueue(EmailMessage(subject, 'Body', to=['manager@example.com']))
+        self.assertTrue(self.queue.drain(5))
+
+    def sent_subjects(self):
+        return [message.subject for message in mail.outbox]
+
+    def test_batches_share_a_connection(self):
+        with mock.patch.object(mail_module, 'get_connection', wraps=mail_module.get_connection) as get_connection:
+            self.send('1', '2', '3', '4', '5')
+        self.assertEqual(self.sent_subjects(), ['1', '2', '3', '4', '5'])
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(self.queue.stats()['sent'], 5)
+
+    @override_settings(EMAIL_BACKEND='warehouse.tests.test_mail.FlakyBackend')
+    def test_only_unsent_messages_are_retried(self):
+        FlakyBackend.failures = {'2'}
+        self.send('1', '2', '3')
+        self.assertEqual(self.sent_subjects(), ['1', '2', '3'])
+        stats = self.queue.stats()
+        self.assertEqual((stats['sent'], stats['retried'], stats['failed']), (3, 1, 0))
+
+    @override_settings(EMAIL_BACKEND='warehouse.tests.test_mail.FlakyBackend', MAIL_QUEUE_MAX_RETRIES=0)
+    def test_messages_are_given_up_on_after_the_retries(self):
+        FlakyBackend.failures = {'1'}
+        self.send('1')
+        self.assertEqual(self.sent_subjects(), [])
+        self.assertEqual(self.queue.stats()['failed'], 1)
+
+    @override_settings(EMAIL_BACKEND='warehouse.tests.test_mail.BlockingBackend', MAIL_QUEUE_MAX_SIZE=1)
+    def test_full_queue_drops_messages(self):
+        BlockingBackend.sending.clear()
+        BlockingBackend.release.clear()
+        message = EmailMessage('1', 'Body', to=['manager@example.com'])
+        self.assertTrue(self.queue.enqueue(message))
+        self.assertTrue(BlockingBackend.sending.wait(5))
+        # The worker is busy with the first message, so the second fills the queue
+        self.assertTrue(self.queue.enqueue(EmailMessage('2', 'Body', to=['manager@example.com'])))
+        self.assertFalse(self.queue.enqueue(EmailMessage('3', 'Body', to=['manager@example.com'])))
+        BlockingBackend.release.set()
+        self.assertTrue(self.queue.drain(5))
+        self.assertEqual(self.sent_subjects(), ['1', '2'])
+        self.assertEqual(self.queue.stats()['dropped'], 1)
+
+    def test_stopped_worker_restarts_on_the_queued_messages(self):
+        self.send('1')
+        self.queue._stopping.set()
+        self.queue._worker.join(5)
+        # Queued while no worker was running
+        self.queue._queue.put_nowait(EmailMessage('2', 'Body', to=['manager@example.com']))
+        self.send('3')
+        self.assertEqual(self.sent_subjects(), ['1', '2', '3'])
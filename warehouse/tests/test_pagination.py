@@ -0,0 +1,25 @@
+from django.test import TransactionTestCase
+
+from warehouse.replicas import REPLICA
+from warehouse.tests.factories import create_invoices, create_movements, create_products
+
+
+class MaxPageSizeTests(TransactionTestCase):
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        self.product = create_products(1)[0]
+
+    def assertPageSize(self, size, path):
+        response = self.client.get(path, {'page_size': 1000})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), size)
+
+    def test_stock_movement_pages_are_capped(self):
+        create_movements(self.product, 101)
+        self.assertPageSize(100, '/warehouse/stock-movement/')
+        self.assertPageSize(100, '/warehouse/async/stock-movement/')
+
+    def test_invoice_pages_are_capped(self):
+        create_invoices([self.product], 101)
+        self.assertPageSize(100, '/warehouse/invoices-list/')
@@ -0,0 +1,53 @@
+from django.core.cache import cache
+from django.db import connections
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from warehouse.replicas import REPLICA
+from warehouse.tests.factories import create_invoices, create_movements, create_products, create_supplier
+
+
+class QueryCountTests(TransactionTestCase):
+    """
+    Each endpoint runs the same number of queries with a few rows as with more than a page of them
+    """
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        cache.clear()
+
+    def assertQueries(self, num, path):
+        """
+        Asserts that GETting `path` runs `num` queries, counted over the primary and the replica
+        """
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections[REPLICA]) as replica:
+                response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        queries = [query['sql'] for query in primary.captured_queries + replica.captured_queries]
+        self.assertEqual(len(queries), num, '\n'.join(queries))
+
+    def test_product_list(self):
+        create_products(2)
+        self.assertQueries(1, '/warehouse/products/')
+        create_products(20, create_supplier('Other'))
+        self.assertQueries(1, '/warehouse/products/')
+
+    def test_product_detail(self):
+        product = create_products(2)[0]
+        self.assertQueries(1, f'/warehouse/products/{product.pk}')
+        create_products(20, create_supplier('Other'))
+        self.assertQueries(1, f'/warehouse/products/{product.pk}')
+
+    def test_stock_movement_list(self):
+        product = create_products(1)[0]
+        create_movements(product, 2)
+        self.assertQueries(1, '/warehouse/stock-movement/')
+        create_movements(create_products(1, create_supplier('Other'))[0], 20)
+        self.assertQueries(1, '/warehouse/stock-movement/')
+
+    def test_invoice_list(self):
+        create_invoices(create_products(2), 2)
+        self.assertQueries(2, '/warehouse/invoices-list/')
+        create_invoices(create_products(3, create_supplier('Other')), 20)
+        self.assertQueries(2, '/warehouse/invoices-list/')
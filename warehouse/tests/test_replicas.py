@@ -0,0 +1,147 @@
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from warehouse import models
+from warehouse.replicas import REPLICA, ReplicaRouter, replica_reads_enabled
+from warehouse.tests.factories import create_invoices, create_movements, create_products, create_user
+
+
+class ReplicaTestCase(TransactionTestCase):
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        cache.clear()
+        self.product = create_products(1)[0]
+        create_movements(self.product, 3)
+        _, self.token = create_user('reader@example.com')
+
+    def get(self, path, token=None):
+        """
+        GETs `path` and returns the response with the SQL sent to the primary and to the replica
+        """
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections[REPLICA]) as replica:
+                response = self.client.get(path, headers=headers)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400)
+        return response, [query['sql'] for query in primary], [query['sql'] for query in replica]
+
+    def assertReadsFrom(self, alias, path, table, token=None):
+        _, primary, replica = self.get(path, token)
+        reads = {'default': primary, REPLICA: replica}
+        other = REPLICA if alias == 'default' else 'default'
+        self.assertTrue(any(table in sql for sql in reads[alias]), f'{table} was not read from {alias}')
+        self.assertFalse(any(table in sql for sql in reads[other]), f'{table} was read from {other}')
+
+
+class ReplicaRoutingTests(ReplicaTestCase):
+    def test_list_views_read_from_replica(self):
+        self.assertReadsFrom(REPLICA, '/warehouse/stock-movement/', 'warehouse_stockmovement', self.token)
+        self.assertReadsFrom(REPLICA, '/warehouse/invoices-list/', 'warehouse_invoice', self.token)
+
+    def test_exports_read_from_replica_while_streaming(self):
+        self.assertReadsFrom(REPLICA, '/warehouse/stock-movement/export/csv/', 'warehouse_stockmovement', self.token)
+
+    def test_authentication_reads_from_primary(self):
+        _, primary, replica = self.get('/warehouse/stock-movement/', self.token)
+        self.assertTrue(any('FROM "authtoken_token"' in sql for sql in primary))
+        self.assertFalse(any('FROM "authtoken_token"' in sql or 'FROM "warehouse_user"' in sql for sql in replica))
+
+    def test_other_views_read_from_primary(self):
+        self.assertReadsFrom('default', '/warehouse/products/', 'warehouse_product', self.token)
+        self.assertReadsFrom('default', f'/warehouse/invoices-retrieve/{create_invoices([self.product], 1)[0].pk}/',
+                             'warehouse_invoice', self.token)
+
+    def test_router_keeps_user_tables_on_primary(self):
+        router = ReplicaRouter()
+        token = replica_reads_enabled.set(True)
+        try:
+            self.assertEqual(router.db_for_read(models.StockMovement), REPLICA)
+            self.assertIsNone(router.db_for_read(models.User))
+            self.assertIsNone(router.db_for_read(models.InvoiceNumberCounter))
+        finally:
+            replica_reads_enabled.reset(token)
+        self.assertIsNone(router.db_for_read(models.StockMovement))
+
+    def test_replica_is_not_migrated(self):
+        self.assertFalse(ReplicaRouter().allow_migrate(REPLICA, 'warehouse'))
+        self.assertTrue(ReplicaRouter().allow_migrate('default', 'warehouse'))
+
+
+class ReplicaStickinessTests(ReplicaTestCase):
+    def setUp(self):
+        super().setUp()
+        _, self.manager_token = create_user('manager@example.com', 'Warehouse Manager')
+        _, self.cashier_token = create_user('cashier@example.com', 'Cashier')
+
+    def create_supplier(self):
+        response = self.client.post(
+            '/warehouse/suppliers/', {'name': 'New', 'email': 'new@example.com', 'phoneNumber': '123'},
+            content_type='application/json', headers={'Authorization': f'Token {self.manager_token}'}
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_writer_reads_from_primary_after_unsafe_request(self):
+        self.assertReadsFrom(REPLICA, '/warehouse/stock-movement/', 'warehouse_stockmovement', self.manager_token)
+        self.create_supplier()
+        self.assertReadsFrom('default', '/warehouse/stock-movement/', 'warehouse_stockmovement', self.manager_token)
+
+    def test_writes_made_by_safe_requests_pin_the_client(self):
+        invoice = create_invoices([self.product], 1)[0]
+        _, primary, _ = self.get(f'/warehouse/invoices-paid/{invoice.pk}/', self.cashier_token)
+        self.assertTrue(any(sql.startswith('UPDATE "warehouse_invoice"') for sql in primary))
+        self.assertReadsFrom('default', '/warehouse/invoices-list/', 'warehouse_invoice', self.cashier_token)
+
+    def test_only_the_writing_client_is_pinned(self):
+        self.create_supplier()
+        self.assertReadsFrom(REPLICA, '/warehouse/stock-movement/', 'warehouse_stockmovement', self.token)
+        self.assertReadsFrom(REPLICA, '/warehouse/stock-movement/', 'warehouse_stockmovement')
+
+    def test_failed_writes_do_not_pin(self):
+        response = self.client.post(
+            '/warehouse/suppliers/', {}, content_type='application/json',
+            headers={'Authorization': f'Token {self.manager_token}'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertReadsFrom(REPLICA, '/warehouse/stock-movement/', 'warehouse_stockmovement', self.manager_token)
+
+    @override_settings(REPLICA_STICKY_WINDOW=1)
+    def test_pin_expires_after_sticky_window(self):
+        self.create_supplier()
+        self.assertReadsFrom('default', '/warehouse/stock-movement/', 'warehouse_stockmovement', self.manager_token)
+        time.sleep(1.1)
+        self.assertReadsFrom(REPLICA, '/warehouse/stock-movement/', 'warehouse_stockmovement', self.manager_token)
+
+
+class ReplicaAnalyticsCacheTests(ReplicaTestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        # The analytics cache is only used with a cache shared by all workers, which a file based cache is
+        shared_cache = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.cache_dir.name,
+        }})
+        shared_cache.enable()
+        self.addCleanup(self.cache_dir.cleanup)
+        self.addCleanup(shared_cache.disable)
+        super().setUp()
+        _, self.manager_token = create_user('manager@example.com', 'Warehouse Manager')
+
+    def test_results_read_from_replica_are_not_cached(self):
+        for _ in range(2):
+            self.assertReadsFrom(REPLICA, '/warehouse/analytics/stock-value/', 'warehouse_product', self.token)
+
+    def test_results_read_from_primary_are_cached(self):
+        self.client.post(
+            '/warehouse/suppliers/', {'name': 'New', 'email': 'new@example.com', 'phoneNumber': '123'},
+            content_type='application/json', headers={'Authorization': f'Token {self.manager_token}'}
+        )
+        self.assertReadsFrom('default', '/warehouse/analytics/stock-value/', 'warehouse_product', self.manager_token)
+        _, primary, replica = self.get('/warehouse/analytics/stock-value/', self.manager_token)
+        self.assertFalse(any('warehouse_product' in sql for sql in primary + replica))
@@ -0,0 +1,47 @@
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase
+
+from warehouse.search import ProductSearchBackend, ngram_product_search
+from warehouse.tests.factories import create_products
+
+
+class NgramProductSearchTests(TestCase):
+    def setUp(self):
+        self.product = create_products(1)[0]
+        # Builds the index, which the signals then keep current
+        ngram_product_search._names = None
+        ngram_product_search.search('product', 10)
+
+    def search(self, query):
+        return [product_id for product_id, _ in ngram_product_search.search(query, 10)]
+
+    def test_committed_changes_are_indexed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Brown sugar'
+            self.product.save()
+        self.assertEqual(self.search('sugar'), [self.product.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product_id = self.product.pk
+            self.product.delete()
+        self.assertNotIn(product_id, self.search('sugar'))
+
+    def test_rolled_back_changes_are_not_indexed(self):
+        product_id = self.product.pk
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            sugar = create_products(1, self.product.supplier)[0]
+            sugar.name = 'Brown sugar'
+            sugar.save()
+            self.product.delete()
+            raise RuntimeError
+        self.assertEqual(self.search('sugar'), [])
+        self.assertEqual(self.search('product'), [product_id])
+
+
+class ProductSearchBackendTests(SimpleTestCase):
+    def test_backends_must_implement_search(self):
+        class IncompleteSearch(ProductSearchBackend):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteSearch()
@@ -0,0 +1,76 @@
+import datetime
+import zoneinfo
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from warehouse import models, utils
+from warehouse.tests.factories import create_products, create_user
+
+NEW_YORK = zoneinfo.ZoneInfo('America/New_York')
+
+
+class StockLevelTests(TestCase):
+    def setUp(self):
+        self.product = create_products(1, stock_value=3)[0]
+        _, self.token = create_user('reader@example.com')
+        # Stock goes 0 -> 1 on Dec 31, -> 2 in the morning of Jan 1 and -> 3 on Jan 2, New York time
+        models.StockMovement.objects.bulk_create([
+            models.StockMovement(
+                date=date.replace(tzinfo=NEW_YORK), product=self.product, quantity=1,
+                movement_type=models.StockMovement.INCREASE, stock_before=index, stock_after=index + 1
+            )
+            for index, date in enumerate([
+                datetime.datetime(2023, 12, 31, 12), datetime.datetime(2024, 1, 1, 10), datetime.datetime(2024, 1, 2, 12),
+            ])
+        ])
+
+    def stock_at(self, at, product=None):
+        return self.client.get(
+            f'/warehouse/products/{(product or self.product).pk}/stock-at/', {'at': at.isoformat()},
+            headers={'Authorization': f'Token {self.token}'}
+        )
+
+    def test_days_are_local(self):
+        with timezone.override(NEW_YORK):
+            call_command('backfill_stock_snapshots', stdout=StringIO())
+            self.assertEqual(
+                set(models.StockSnapshot.objects.values_list('day', 'stock_value')),
+                {(datetime.date(2023, 12, 31), 1), (datetime.date(2024, 1, 1), 2), (datetime.date(2024, 1, 2), 3)}
+            )
+            # The evening of Jan 1 in New York is already Jan 2 in UTC
+            response = self.stock_at(datetime.datetime(2024, 1, 1, 20, tzinfo=NEW_YORK))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stock_value'], 2)
+
+    def test_days_are_local_whatever_the_time_zone_of_at(self):
+        with timezone.override(NEW_YORK):
+            call_command('backfill_stock_snapshots', stdout=StringIO())
+            at = datetime.datetime(2024, 1, 1, 20, tzinfo=NEW_YORK).astimezone(datetime.timezone.utc)
+            self.assertEqual(utils.stock_level_at(self.product.pk, at), 2)
+
+    def test_stock_before_any_movement(self):
+        response = self.stock_at(datetime.datetime(2023, 1, 1, tzinfo=NEW_YORK))
+        self.assertEqual(response.data['stock_value'], 0)
+
+    def test_inactive_products_are_not_found(self):
+        self.product.status = models.INACTIVE
+        self.product.save()
+        self.assertEqual(self.stock_at(timezone.now()).status_code, 404)
+
+    def test_at_is_required(self):
+        response = self.client.get(
+            f'/warehouse/products/{self.product.pk}/stock-at/', headers={'Authorization': f'Token {self.token}'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_backfill_replaces_the_snapshots_of_each_product(self):
+        call_command('backfill_stock_snapshots', stdout=StringIO())
+        stale = models.StockSnapshot.objects.filter(product=self.product).first()
+        stale.stock_value = 100
+        stale.save()
+        call_command('backfill_stock_snapshots', product=self.product.pk, stdout=StringIO())
+        self.assertEqual(models.StockSnapshot.objects.filter(product=self.product).count(), 3)
+        self.assertFalse(models.StockSnapshot.objects.filter(stock_value=100).exists())
@@ -0,0 +1,57 @@
+from django.test import TestCase
+
+from warehouse import models
+from warehouse.tests.factories import create_products, create_user
+
+
+class BulkStockUpdateTests(TestCase):
+    def setUp(self):
+        self.products = create_products(2, stock_value=5)
+        _, self.token = create_user('manager@example.com', 'Warehouse Manager')
+
+    def post(self, items):
+        return self.client.post(
+            '/warehouse/stock-update/bulk/', {'items': items}, content_type='application/json',
+            headers={'Authorization': f'Token {self.token}'}
+        )
+
+    def test_changes_are_applied(self):
+        response = self.post([
+            {'productId': self.products[0].pk, 'quantity': 2, 'changeType': models.StockMovement.DECREASE},
+            {'productId': self.products[1].pk, 'quantity': 3, 'changeType': models.StockMovement.INCREASE},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(models.Product.objects.order_by('id').values_list('stock_value', flat=True)), [3, 8]
+        )
+
+    def test_insufficient_stock_names_the_failing_item(self):
+        product_id = self.products[1].pk
+        response = self.post([
+            {'productId': self.products[0].pk, 'quantity': 2, 'changeType': models.StockMovement.DECREASE},
+            {'productId': product_id, 'quantity': 3, 'changeType': models.StockMovement.DECREASE},
+            {'productId': product_id, 'quantity': 3, 'changeType': models.StockMovement.DECREASE},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()['detail'], {'items': {'2': {'quantity': [f'Insufficient stock for product {product_id}']}}}
+        )
+        # None of the items is applied
+        self.assertEqual(list(models.Product.objects.values_list('stock_value', flat=True)), [5, 5])
+        self.assertFalse(models.StockMovement.objects.exists())
+
+    def test_inactive_and_missing_products_are_reported_per_item(self):
+        inactive = self.products[1]
+        inactive.status = models.INACTIVE
+        inactive.save()
+        response = self.post([
+            {'productId': self.products[0].pk, 'quantity': 1, 'changeType': models.StockMovement.INCREASE},
+            {'productId': inactive.pk, 'quantity': 1, 'changeType': models.StockMovement.INCREASE},
+            {'productId': 0, 'quantity': 1, 'changeType': models.StockMovement.INCREASE},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'], {'items': {
+            '1': {'productId': [f'Product {inactive.pk} does not exist or is not active']},
+            '2': {'productId': ['Product 0 does not exist or is not active']},
+        }})
+        self.assertFalse(models.StockMovement.objects.exists())
@@ -0,0 +1,51 @@
+from asgiref.testing import ApplicationCommunicator
+from django.test import SimpleTestCase, override_settings
+
+from warehouse.uploads import RequestBodyLimit
+
+
+@override_settings(UPLOAD_MAX_REQUEST_SIZE=1024)
+class RequestBodyLimitTests(SimpleTestCase):
+    async def post(self, chunks, content_length=None):
+        """
+        POSTs `chunks` through the limit to an application reading the whole body, and returns the response status
+        with the bytes the application received
+        """
+        received = []
+
+        async def app(scope, receive, send):
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                received.append(message['body'])
+                if not message.get('more_body'):
+                    break
+            await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        headers = [(b'content-length', str(content_length).encode())] if content_length is not None else []
+        communicator = ApplicationCommunicator(
+            RequestBodyLimit(app), {'type': 'http', 'method': 'POST', 'path': '/', 'headers': headers}
+        )
+        for index, chunk in enumerate(chunks):
+            await communicator.send_input({'type': 'http.request', 'body': chunk, 'more_body': index < len(chunks) - 1})
+        start = await communicator.receive_output()
+        await communicator.receive_output()
+        await communicator.wait()
+        return start['status'], b''.join(received)
+
+    async def test_small_bodies_pass(self):
+        status, received = await self.post([b'x' * 1024], content_length=1024)
+        self.assertEqual(status, 204)
+        self.assertEqual(len(received), 1024)
+
+    async def test_large_content_length_is_refused_before_reading(self):
+        status, received = await self.post([b'x' * 512] * 4, content_length=2048)
+        self.assertEqual(status, 413)
+        self.assertEqual(received, b'')
+
+    async def test_large_bodies_without_content_length_are_cut_off(self):
+        status, received = await self.post([b'x' * 512] * 4)
+        self.assertEqual(status, 413)
+        self.assertLessEqual(len(received), 1024)
@@ -0,0 +1,94 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+class RequestBodyLimit:
+    """
+    ASGI middleware answering 413 to HTTP requests whose body is larger than UPLOAD_MAX_REQUEST_SIZE bytes. Django's
+    ASGI handler spools the whole body to a temporary file before any upload handler runs, so oversized uploads are
+    refused here instead: on their Content-Length before anything is read, or as soon as a body sent without one
+    grows past the limit.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        limit = settings.UPLOAD_MAX_REQUEST_SIZE
+        content_length = dict(scope['headers']).get(b'content-length')
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            return await self.reject(send)
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    # Django stops reading and returns without a response when the client goes away
+                    exceeded = True
+                    return {'type': 'http.disconnect'}
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            response_started = response_started or message['type'] == 'http.response.start'
+            await send(message)
+
+        await self.app(scope, limited_receive, tracked_send)
+        if exceeded and not response_started:
+            await self.reject(send)
+
+    @staticmethod
+    async def reject(send):
+        body = json.dumps(
+            {'detail': f'Requests may be at most {settings.UPLOAD_MAX_REQUEST_SIZE} bytes'}
+        ).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'connection', b'close'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+class UploadSizeLimitHandler(FileUploadHandler):
+    """
+    Passes uploaded chunks on to the next handler while counting them, and aborts the request as soon as a file grows
+    past UPLOAD_MAX_FILE_SIZE bytes. Under WSGI the rest of the body is then never read; under ASGI it has already
+    been received, bounded by `RequestBodyLimit`.
+    """
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.received = 0
+        if content_length is not None and content_length > settings.UPLOAD_MAX_FILE_SIZE:
+            self.reject()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_FILE_SIZE:
+            self.reject()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+    def reject(self):
+        raise RequestDataTooBig(
+            f'The file "{self.file_name}" is larger than the upload limit of {settings.UPLOAD_MAX_FILE_SIZE} bytes'
+        )
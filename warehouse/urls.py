@@ -1,7 +1,7 @@
 
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('auth/register/', views.register, name='register'),
@@ -18,14 +18,30 @@ urlpatterns = [
     path('warehouse/suppliers/', views.SupplierListView.as_view(), name='suppliers_list'),
     path('warehouse/suppliers/<pk>', views.SupplierDetailView.as_view(), name='suppliers_detail'),
     path('warehouse/products/', views.ProductListView.as_view(), name='products_list'),
+    path('warehouse/products/search/', views.search_products, name='products_search'),
     path('warehouse/products/<pk>', views.ProductDetailView.as_view(), name='products_detail'),
+    path('warehouse/products/<pk>/stock-at/', views.product_stock_at, name='products_stock_at'),
+    path('warehouse/stock-update/bulk/', views.bulk_stock_update, name='bulk_stock_update'),
     path('warehouse/stock-update/<product_id>/', views.stock_update, name='stock_update'),
     path('warehouse/stock-movement/', views.StockMovementListView.as_view(), name='stock_movement_list'),
+    path('warehouse/stock-movement/export/<file_format>/', views.export_stock_movements, name='stock_movement_export'),
     path('warehouse/invoices-create/', views.create_invoice, name='stock_update'),
-    path('warehouse/invoices-list/', views.list_invoices, name='stock_update'),
+    path('warehouse/invoices-list/', views.InvoiceListView.as_view(), name='invoice_list'),
+    path('warehouse/invoices-export/<file_format>/', views.export_invoices, name='invoice_export'),
     path('warehouse/invoices-retrieve/<pk>/', views.retrieve_invoice, name='retrieve_invoice'),
     path('warehouse/invoices-update/<pk>/', views.update_invoice, name='update_invoice'),
     path('warehouse/invoices-delete/<pk>/', views.delete_invoice, name='delete_invoice'),
     path('warehouse/invoices-paid/<pk>/', views.pay_invoice, name='pay_invoice'),
     path('warehouse/invoices-supplied/<pk>/', views.supply_invoice, name='supply_invoice'),
+    path('warehouse/sync/suppliers/', views.SupplierSyncView.as_view(), name='sync_suppliers'),
+    path('warehouse/sync/products/', views.ProductSyncView.as_view(), name='sync_products'),
+    path('warehouse/sync/invoices/', views.InvoiceSyncView.as_view(), name='sync_invoices'),
+    path('warehouse/analytics/stock-value/', views.analytics_stock_value, name='analytics_stock_value'),
+    path('warehouse/analytics/movement-velocity/', views.analytics_movement_velocity, name='analytics_movement_velocity'),
+    path('warehouse/analytics/top-products/', views.analytics_top_products, name='analytics_top_products'),
+    path('warehouse/analytics/daily-sales/', views.analytics_daily_sales, name='analytics_daily_sales'),
+    path('warehouse/async/products/', async_views.product_list, name='async_products_list'),
+    path('warehouse/async/products/<pk>', async_views.product_detail, name='async_products_detail'),
+    path('warehouse/async/stock-movement/', async_views.stock_movement_list, name='async_stock_movement_list'),
+    path('warehouse/async/invoices-retrieve/<pk>/', async_views.retrieve_invoice, name='async_retrieve_invoice'),
 ]
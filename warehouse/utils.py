@@ -1,33 +1,97 @@
-import datetime
+import atexit
+import csv
+import json
+import logging
+import os
 import threading
+import time
+from collections import OrderedDict, deque
+from decimal import Decimal
+from itertools import islice
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.core.mail import EmailMessage
-from django.db import transaction
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import F, Prefetch, Sum
+from django.db.models.signals import post_save
+from django.utils import timezone
 from django_filters import rest_framework as filters
 
 from . import models
+from .mail import mail_queue
 
 # from .models import User
 
+logger = logging.getLogger(__name__)
 
-# @shared_task
-def send_email(payload):
+
+class LRUCache:
+    """
+    Thread-safe, process-local LRU cache holding at most `max_size` entries, each expiring `ttl` seconds after it is set
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def build_email(payload):
     subject = payload['subject']
     html_content = payload['html_content']
     to_email = payload['to_email'],
     email = EmailMessage(subject, html_content, to=to_email)
     email.content_subtype = "html"
-    email.send()
+    return email
+
+
+def send_email(payload):
+    mail_queue.enqueue(build_email(payload))
 
 
-def send_threshold_alert(product, managers):
+def send_low_stock_digest(products, managers):
+    product_rows = "".join(
+        f"<li><b>{product.name}</b>: {product.stock_value} {product.product_unit} (threshold {product.threshold_value})</li>"
+        for product in products
+    )
     for user in managers:
         email_body = f"<html>" \
                     f"<head>" \
                     f"</head>" \
                     f"<body>" \
                     f"<p>Hi {user.first_name},</p>" \
-                    f"<p>This is to notify you that the product <b>{product.name}</b> is running low. The current stock is {product.stock_value} {product.product_unit}</p>" \
+                    f"<p>This is to notify you that the following products are running low:</p>" \
+                    f"<ul>{product_rows}</ul>" \
                     f"<p>Consider restocking as soon as possible</p>" \
                     f"</body>" \
                     f"</html>"
@@ -37,13 +101,62 @@ def send_threshold_alert(product, managers):
             'html_content': email_body,
             'to_email': user.email
         }
-        threshold_alert_thread = threading.Thread(
-            target=send_email, args=(payload,)
-        )
-        threshold_alert_thread.start()
+        send_email(payload)
     return
 
 
+class LowStockDigest:
+    """
+    Collects products that dropped to or below their threshold and, LOW_STOCK_ALERT_WINDOW seconds after the first
+    one, sends every Warehouse Manager a single email listing those still low on stock.
+    """
+
+    def __init__(self):
+        self._product_ids = set()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def add(self, product_id):
+        window = settings.LOW_STOCK_ALERT_WINDOW
+        with self._lock:
+            self._product_ids.add(product_id)
+            if window > 0 and self._timer is None:
+                self._timer = threading.Timer(window, self.flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+        if window <= 0:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            product_ids, self._product_ids = self._product_ids, set()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not product_ids:
+            return
+
+        products = [
+            product for product in models.Product.objects.filter(id__in=product_ids).order_by('name')
+            if product.is_low_on_stock
+        ]
+        if products:
+            managers = models.User.objects.filter(groups__name='Warehouse Manager')
+            send_low_stock_digest(products, managers)
+
+    def flush_in_background(self):
+        try:
+            self.flush()
+        except Exception as exc:
+            logger.warning('Sending the low stock digest failed: %s', exc)
+        finally:
+            connection.close()
+
+
+low_stock_digest = LowStockDigest()
+atexit.register(low_stock_digest.flush_in_background)
+
+
 def send_pw_reset_email(token, user):
     email_body = f"<html>" \
                 f"<head>" \
@@ -61,10 +174,7 @@ def send_pw_reset_email(token, user):
         'html_content': email_body,
         'to_email': user.email
     }
-    pw_reset_thread = threading.Thread(
-        target=send_email, args=(payload,)
-    )
-    pw_reset_thread.start()
+    send_email(payload)
     return
 
 
@@ -88,17 +198,156 @@ class StockMovementFilter(filters.FilterSet):
     movement_type = filters.CharFilter(field_name='movement_type', lookup_expr='iexact')
 
 
+class SyncFilter(filters.FilterSet):
+    since = filters.IsoDateTimeFilter(field_name='modified', lookup_expr='gte')
+
+
+class InvoiceFilter(filters.FilterSet):
+    invoice_status = filters.CharFilter(field_name='invoice_status', lookup_expr='iexact')
+    date_from = filters.DateFilter(field_name='created__date', lookup_expr='gte')
+    date_to = filters.DateFilter(field_name='created__date', lookup_expr='lte')
+    customer = filters.CharFilter(field_name='customer_name', lookup_expr='icontains')
+
+
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+class Echo:
+    """
+    File-like object whose `write` returns the written value, so csv.writer can be used to build single lines
+    """
+    def write(self, value):
+        return value
+
+
+def export_lines(header, rows, file_format):
+    """
+    Yields `rows` (tuples matching `header`) one line at a time as CSV or NDJSON
+    """
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+async def aiterate(queryset, chunk_size):
+    """
+    Asynchronously yields the rows of `queryset`, fetching `chunk_size` of them at a time in the thread that owns the
+    connection. Unlike `QuerySet.aiterator`, this also works for `values_list` querysets.
+    """
+    rows = queryset.iterator(chunk_size=chunk_size)
+    next_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    try:
+        while chunk := await next_chunk():
+            for row in chunk:
+                yield row
+    finally:
+        await sync_to_async(rows.close)()
+
+
+async def aexport_lines(header, rows, file_format):
+    """
+    Async counterpart of `export_lines`, for `rows` from an async iterator such as `aiterate`
+    """
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(header)
+        async for row in rows:
+            yield writer.writerow(row)
+    else:
+        async for row in rows:
+            yield json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def invoice_products_prefetch():
+    return Prefetch('invoice_products', queryset=models.InvoiceProduct.objects.select_related('product'))
+
+
+INVOICE_NUMBER_SEQUENCE = 'warehouse_invoice_number_seq'
+INVOICE_NUMBER_COUNTER = 'invoice_number'
+
+
+class InvoiceNumberAllocator:
+    """
+    Allocates invoice numbers from the `warehouse_invoice_number_seq` sequence on Postgres, or from the
+    `InvoiceNumberCounter` row on other databases. Numbers are reserved `block_size` at a time and handed out
+    from memory, so a worker only goes to the database once per block.
+    """
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size or settings.INVOICE_NUMBER_BLOCK_SIZE
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reserved = deque()
+
+    def allocate(self):
+        with self._lock:
+            # Reserved numbers must not be shared with forked workers
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._reserved.clear()
+            if not self._reserved:
+                self._reserved.extend(self._reserve_block())
+            return self._reserved.popleft()
+
+    def _reserve_block(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT nextval(%s) FROM generate_series(1, %s)', [INVOICE_NUMBER_SEQUENCE, self.block_size]
+                )
+                return [row[0] for row in cursor.fetchall()]
+
+        # The counter row is transactional: inside an outer transaction a reserved block would be handed back on
+        # rollback while still cached here, so only one number is reserved at a time in that case.
+        block_size = 1 if connection.in_atomic_block else self.block_size
+        with transaction.atomic():
+            counter = models.InvoiceNumberCounter.objects.filter(name=INVOICE_NUMBER_COUNTER)
+            if not counter.update(value=F('value') + block_size):
+                models.InvoiceNumberCounter.objects.create(name=INVOICE_NUMBER_COUNTER, value=block_size)
+            last_number = counter.values_list('value', flat=True).get()
+        return range(last_number - block_size + 1, last_number + 1)
+
+
+invoice_number_allocator = InvoiceNumberAllocator()
+
+
 def generate_invoice_number():
-    last_invoice = models.Invoice.objects.filter(invoice_number__isnull=False).order_by('invoice_number').last()
-    if last_invoice:
-        invoice_number = int(last_invoice.invoice_number.split('-')[-1]) + 1
-        return f'INV-{invoice_number:06}'
-    return 'INV-000001'
+    return f'INV-{invoice_number_allocator.allocate():06}'
+
+
+@transaction.atomic
+def add_invoice_products(invoice, items):
+    """
+    Adds the given `{product_id, quantity}` items to the invoice in one batch and recomputes the invoice total once.
+    """
+    product_ids = {item['product_id'] for item in items}
+    products = models.Product.objects.in_bulk(product_ids)
+    if len(products) != len(product_ids):
+        raise models.Product.DoesNotExist('Product matching query does not exist.')
+
+    invoice_products = [
+        models.InvoiceProduct(
+            invoice=invoice,
+            product=products[item['product_id']],
+            quantity=item['quantity'],
+            cost=(Decimal(item['quantity']) * products[item['product_id']].unit_price).quantize(Decimal('0.01'))
+        )
+        for item in items
+    ]
+    models.InvoiceProduct.objects.bulk_create(invoice_products)
+    invoice.total = sum(invoice.invoice_products.values_list('cost', flat=True))
+    invoice.save(update_fields=['total', 'modified'])
+    return invoice_products
 
 
 def create_product_movement(product_id, quantity, movement_type, user_id, stock_before, invoice_id=None):
-    models.StockMovement.objects.create(
-        date=datetime.datetime.now(),
+    movement = models.StockMovement.objects.create(
+        date=timezone.now(),
         product_id=product_id,
         quantity=quantity,
         movement_type=movement_type,
@@ -106,23 +355,205 @@ def create_product_movement(product_id, quantity, movement_type, user_id, stock_
         invoice_id=invoice_id,
         stock_before=stock_before
     )
+    update_stock_snapshots([movement])
+    return movement
+
+
+class InsufficientStock(ValueError):
+    """
+    Raised by `apply_stock_changes` when the change at position `index` of the batch takes the stock of product
+    `product_id` below zero
+    """
+
+    def __init__(self, index, product_id):
+        super().__init__('Insufficient stock')
+        self.index = index
+        self.product_id = product_id
 
 
 @transaction.atomic
+def apply_stock_changes(changes, user, invoice_id=None):
+    """
+    Applies a batch of `{product_id, change_type, quantity}` stock changes.
+    All affected products are locked with one query ordered by id (so concurrent batches cannot deadlock), each
+    product gets a single conditional UPDATE and the stock movements are written with one bulk_create.
+    Returns the created stock movements, in the order of `changes`, or raises `InsufficientStock` for the first change
+    the stock does not cover.
+    """
+    for change in changes:
+        if change['change_type'] not in [models.StockMovement.DECREASE, models.StockMovement.INCREASE]:
+            raise ValueError('Change type must be either "Decrease" or "Increase"')
+
+    product_ids = {change['product_id'] for change in changes}
+    products = models.Product.objects.select_for_update().filter(id__in=product_ids).order_by('id').in_bulk()
+    if len(products) != len(product_ids):
+        raise models.Product.DoesNotExist('Product matching query does not exist.')
+
+    date = timezone.now()
+    stock = {product_id: product.stock_value for product_id, product in products.items()}
+    decreases = dict.fromkeys(products, 0.0)
+    increases = dict.fromkeys(products, 0.0)
+    last_change = {}
+    movements = []
+    for index, change in enumerate(changes):
+        product_id = change['product_id']
+        last_change[product_id] = index
+        quantity = float(change['quantity'])
+        stock_before = stock[product_id]
+        if change['change_type'] == models.StockMovement.DECREASE:
+            if stock_before < quantity:
+                raise InsufficientStock(index, product_id)
+            decreases[product_id] += quantity
+            stock[product_id] = stock_before - quantity
+        else:
+            increases[product_id] += quantity
+            stock[product_id] = stock_before + quantity
+        movements.append(models.StockMovement(
+            date=date,
+            product=products[product_id],
+            quantity=quantity,
+            movement_type=change['change_type'],
+            user_id=user.id,
+            invoice_id=invoice_id,
+            stock_before=stock_before,
+            stock_after=stock[product_id]
+        ))
+
+    modified = timezone.now()
+    for product_id, product in products.items():
+        queryset = models.Product.objects.filter(id=product_id)
+        if decreases[product_id]:
+            queryset = queryset.filter(stock_value__gte=decreases[product_id] - increases[product_id])
+        updated = queryset.update(
+            stock_value=F('stock_value') - decreases[product_id] + increases[product_id], modified=modified
+        )
+        if not updated:
+            raise InsufficientStock(last_change[product_id], product_id)
+        product.stock_value = stock[product_id]
+        product.modified = modified
+    models.StockMovement.objects.bulk_create(movements)
+    update_stock_snapshots(movements)
+
+    # Queryset updates bypass Product.save, so notify the post_save receivers explicitly
+    for product in products.values():
+        post_save.send(
+            sender=models.Product, instance=product, created=False, update_fields={'stock_value', 'modified'},
+            raw=False, using=transaction.get_connection().alias
+        )
+    return movements
+
+
+def local_day(date):
+    return timezone.localtime(date).date() if timezone.is_aware(date) else date.date()
+
+
+def summarize_movements(movements):
+    """
+    Groups stock movements, given in the order they happened, into per `(product_id, day)` snapshot values.
+    """
+    summaries = {}
+    for movement in movements:
+        summary = summaries.setdefault(
+            (movement.product_id, local_day(movement.date)),
+            {'total_increase': 0.0, 'total_decrease': 0.0, 'movement_count': 0}
+        )
+        if movement.movement_type == models.StockMovement.INCREASE:
+            summary['total_increase'] += movement.quantity
+        else:
+            summary['total_decrease'] += movement.quantity
+        summary['movement_count'] += 1
+        summary['stock_value'] = movement.stock_after
+        summary['last_movement_id'] = movement.id
+    return summaries
+
+
+def update_stock_snapshots(movements):
+    """
+    Folds newly created stock movements into the daily stock snapshots of their products.
+    Callers hold the product rows locked (or have just updated them), so concurrent writers cannot race here.
+    """
+    modified = timezone.now()
+    for (product_id, day), summary in summarize_movements(movements).items():
+        updated = models.StockSnapshot.objects.filter(product_id=product_id, day=day).update(
+            stock_value=summary['stock_value'],
+            last_movement_id=summary['last_movement_id'],
+            total_increase=F('total_increase') + summary['total_increase'],
+            total_decrease=F('total_decrease') + summary['total_decrease'],
+            movement_count=F('movement_count') + summary['movement_count'],
+            modified=modified
+        )
+        if not updated:
+            models.StockSnapshot.objects.create(product_id=product_id, day=day, **summary)
+
+
+def stock_level_at(product_id, at):
+    """
+    Returns the stock of a product at the datetime `at`, using the movements of `at`'s own day and otherwise the
+    closing stock of the latest earlier snapshot.
+    """
+    # Days are those of the current time zone, as for the snapshots
+    local = timezone.localtime(at) if timezone.is_aware(at) else at
+    start_of_day = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    movement = models.StockMovement.objects.filter(
+        product_id=product_id, date__gte=start_of_day, date__lte=at
+    ).order_by('-date', '-id').first()
+    if movement:
+        return movement.stock_after
+
+    snapshot = models.StockSnapshot.objects.filter(
+        product_id=product_id, day__lt=local.date()
+    ).order_by('-day').first()
+    if snapshot:
+        return snapshot.stock_value
+
+    # Nothing recorded before `at`: the stock then is what the next movement started from
+    next_movement = models.StockMovement.objects.filter(product_id=product_id, date__gt=at).order_by('date', 'id').first()
+    if next_movement:
+        return next_movement.stock_before
+    return models.Product.objects.values_list('stock_value', flat=True).get(id=product_id)
+
+
+def update_sales_rollup(day, updates):
+    """
+    Applies `updates` ({product_id: {field: expression}}) to the daily sales rollup rows of `day`, creating them first
+    """
+    models.DailySalesRollup.objects.bulk_create(
+        [models.DailySalesRollup(day=day, product_id=product_id) for product_id in updates], ignore_conflicts=True
+    )
+    modified = timezone.now()
+    for product_id, fields in updates.items():
+        models.DailySalesRollup.objects.filter(day=day, product_id=product_id).update(**fields, modified=modified)
+
+
+def record_invoice_sales(invoice, sign=1):
+    """
+    Adds the lines of a paid invoice to the sales rollup of its payment day, or takes them out again with sign=-1
+    """
+    lines = invoice.invoice_products.values('product_id').annotate(quantity=Sum('quantity'), revenue=Sum('cost'))
+    update_sales_rollup(local_day(invoice.date_paid), {
+        line['product_id']: {
+            'quantity_sold': F('quantity_sold') + sign * line['quantity'],
+            'revenue': F('revenue') + sign * (line['revenue'] or 0),
+            'invoice_count': F('invoice_count') + sign,
+        }
+        for line in lines
+    })
+
+
+def record_invoice_delivery(invoice, sign=1):
+    """
+    Adds the lines of a delivered invoice to the sales rollup of its delivery day, or takes them out with sign=-1
+    """
+    lines = invoice.invoice_products.values('product_id').annotate(quantity=Sum('quantity'))
+    update_sales_rollup(local_day(invoice.date_supplied), {
+        line['product_id']: {'quantity_delivered': F('quantity_delivered') + sign * line['quantity']}
+        for line in lines
+    })
+
+
 def update_stock(product, change_type, quantity, user, invoice_id=None):
-    if change_type not in ['Decrease', 'Increase']:
-        raise ValueError('Change type must be either "Decrease" or "Increase"')
-
-    stock_before = product.stock_value
-    if change_type == 'Decrease' and product.stock_value < float(quantity):
-        raise ValueError('Insufficient stock')
-    if change_type == 'Decrease':
-        product.stock_value -= float(quantity)
-        product.save()
-        create_product_movement(product.id, float(quantity), models.StockMovement.DECREASE, user.id, stock_before, invoice_id)
-    else:
-        product.stock_value += float(quantity)
-        product.save()
-        create_product_movement(product.id, float(quantity), models.StockMovement.INCREASE, user.id, stock_before, invoice_id)
-    product.refresh_from_db()
+    changes = [{'product_id': product.id, 'change_type': change_type, 'quantity': quantity}]
+    movement = apply_stock_changes(changes, user, invoice_id)[0]
+    product.stock_value = movement.stock_after
+    product.modified = movement.product.modified
     return product
@@ -3,9 +3,16 @@ import math
 import uuid
 
 import django_filters
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import Group
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
+from django.db.models import Max
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, parse_http_date_safe
 from djangorestframework_camel_case.parser import (
     CamelCaseFormParser,
     CamelCaseJSONParser,
@@ -15,12 +22,53 @@ from drf_spectacular.utils import extend_schema
 from rest_framework import generics, status
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import api_view, parser_classes, permission_classes
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from warehouse import models, permissions, serializers, utils
-from warehouse.utils import update_stock
+from warehouse import (
+    analytics,
+    caching,
+    models,
+    permissions,
+    replicas,
+    search,
+    serializers,
+    utils,
+)
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+STOCK_MOVEMENT_EXPORT_FIELDS = {
+    'id': 'id',
+    'date': 'date',
+    'product_id': 'product_id',
+    'product': 'product__name',
+    'quantity': 'quantity',
+    'movement_type': 'movement_type',
+    'invoice_number': 'invoice__invoice_number',
+    'stock_before': 'stock_before',
+    'stock_after': 'stock_after',
+    'user': 'user__email',
+}
+
+INVOICE_EXPORT_FIELDS = {
+    'invoice_id': 'invoice_id',
+    'invoice_number': 'invoice__invoice_number',
+    'customer_name': 'invoice__customer_name',
+    'customer_contact': 'invoice__customer_contact',
+    'invoice_status': 'invoice__invoice_status',
+    'invoice_total': 'invoice__total',
+    'created': 'invoice__created',
+    'date_paid': 'invoice__date_paid',
+    'date_supplied': 'invoice__date_supplied',
+    'product_id': 'product_id',
+    'product': 'product__name',
+    'quantity': 'quantity',
+    'cost': 'cost',
+}
 
 
 class PageSizeAndNumberPagination(PageNumberPagination):
@@ -35,6 +83,56 @@ class PageSizeAndNumberPagination(PageNumberPagination):
         return Response(page_obj)
 
 
+class CachedListMixin:
+    """
+    Serves `list` through the response cache. `cache_models` are the models the listed data is built from.
+    """
+    cache_models = []
+
+    def list(self, request, *args, **kwargs):
+        return caching.cached_response(
+            request, self.cache_models, lambda: super(CachedListMixin, self).list(request, *args, **kwargs)
+        )
+
+
+class StockMovementCursorPagination(CursorPagination):
+    """
+    Keyset pagination over `(date, id)`, so deep pages cost the same as the first one
+    """
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ('-date', '-id')
+
+
+class SyncCursorPagination(CursorPagination):
+    """
+    Keyset pagination over `(modified, id)` that also returns the `watermark` to pass as `since` on the next sync
+    """
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    ordering = ('modified', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Rows saved in transactions that commit a little later can carry an older `modified`, so the watermark
+        # trails the query by SYNC_SAFETY_WINDOW seconds and the next sync re-reads that window
+        self.watermark = timezone.now() - datetime.timedelta(seconds=settings.SYNC_SAFETY_WINDOW)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['watermark'] = self.watermark
+        return response
+
+
+class InvoiceCursorPagination(CursorPagination):
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ('-created', '-id')
+
+
 @extend_schema(methods=['POST'], description='This endpoint handles registration', request=serializers.RegisterSerializer)
 @api_view(['POST'])
 @parser_classes([CamelCaseFormParser, CamelCaseMultiPartParser])
@@ -153,11 +251,10 @@ class UserRetrieveView(generics.RetrieveAPIView):
 @extend_schema(description='This endpoint returns a list of available roles in the system. The Admin can then select the roles to assign to users')
 @api_view()
 def get_roles(request):
-    roles = Group.objects.values('id', 'name')
-    return Response(roles)
+    return caching.cached_response(request, [Group], lambda: Response(Group.objects.values('id', 'name')))
 
 
-class SupplierListView(generics.ListCreateAPIView):
+class SupplierListView(CachedListMixin, generics.ListCreateAPIView):
     """
     get:
     Return a list of supplier objects
@@ -167,6 +264,7 @@ class SupplierListView(generics.ListCreateAPIView):
     """
     permission_classes = [permissions.IsWareHouseManager]
     serializer_class = serializers.SupplierSerializer
+    cache_models = [models.Supplier]
 
     def get_queryset(self):
         return models.Supplier.objects.filter(status=models.ACTIVE)
@@ -193,7 +291,7 @@ class SupplierDetailView(generics.RetrieveUpdateDestroyAPIView):
         instance.save()
 
 
-class ProductListView(generics.ListCreateAPIView):
+class ProductListView(CachedListMixin, generics.ListCreateAPIView):
     """
     get:
         Return a list of product objects
@@ -205,9 +303,26 @@ class ProductListView(generics.ListCreateAPIView):
     serializer_class = serializers.ProductSerializer
     filter_backends = [django_filters.rest_framework.DjangoFilterBackend]
     filterset_class = utils.ProductFilter
+    cache_models = [models.Product, models.Supplier]
 
     def get_queryset(self):
-        return models.Product.objects.filter(status=models.ACTIVE).all()
+        return models.Product.objects.filter(status=models.ACTIVE).select_related('supplier')
+
+
+@extend_schema(parameters=[serializers.ProductSearchQuerySerializer], description='This endpoint searches active products by name, tolerating typos, best match first. Names starting with `q` rank highest. With `autocomplete=true` only the id, name and supplier of each match are returned')
+@api_view()
+def search_products(request):
+    serializer = serializers.ProductSearchQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+    results = search.get_product_search_backend().products(params['q'], params['limit'])
+    if params['autocomplete']:
+        return Response([
+            {'id': product.id, 'name': product.name, 'supplier': product.supplier.name} for product, _ in results
+        ])
+    return Response([
+        {**serializers.ProductSerializer(product).data, 'score': score} for product, score in results
+    ])
 
 
 class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -224,19 +339,31 @@ class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
     allowed_methods = ['patch', 'delete', 'get']
 
     def get_queryset(self):
-        return models.Product.objects.filter(status=models.ACTIVE).all()
+        return models.Product.objects.filter(status=models.ACTIVE).select_related('supplier')
 
     def perform_destroy(self, instance):
         instance.status = models.INACTIVE
         instance.save()
 
 
+@extend_schema(parameters=[serializers.StockLevelQuerySerializer], description='This endpoint returns the stock of an active product at the datetime `at`, from the stock movements of that day and the daily stock snapshots')
+@api_view()
+@permission_classes([IsAuthenticated])
+def product_stock_at(request, pk):
+    serializer = serializers.StockLevelQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    at = serializer.validated_data['at']
+    product_id = models.Product.objects.filter(status=models.ACTIVE).values_list('id', flat=True).get(id=pk)
+    return Response({'product_id': product_id, 'at': at, 'stock_value': utils.stock_level_at(product_id, at)})
+
+
 @transaction.atomic
 def supply_invoice_items(invoice, user):
-    invoice_products = models.InvoiceProduct.objects.filter(invoice=invoice)
-    for inv in invoice_products:
-        product = models.Product.objects.get(id=inv.product_id)
-        update_stock(product, 'Decrease', inv.quantity, user, invoice.id)
+    changes = [
+        {'product_id': product_id, 'change_type': models.StockMovement.DECREASE, 'quantity': quantity}
+        for product_id, quantity in invoice.invoice_products.values_list('product_id', 'quantity')
+    ]
+    utils.apply_stock_changes(changes, user, invoice.id)
     return
 
 
@@ -248,7 +375,7 @@ def stock_update(request, product_id):
     data = request.data
     change_type = data.get('change_type')
     # qr_code = data.get('qr_code', None)
-    product = models.Product.objects.get(id=product_id)
+    product = models.Product.objects.select_related('supplier').get(id=product_id)
     if change_type not in ['Increase','Decrease']:
         raise ValueError('Change type must be either "Increase" or "Decrease"')
     # if change_type == 'Increase' and qr_code is None:
@@ -261,6 +388,18 @@ def stock_update(request, product_id):
     return Response(serializers.ProductSerializer(updated_product).data)
 
 
+@extend_schema(methods=['post'], request=serializers.BulkStockUpdateSerializer, description='This endpoint applies several stock updates at once, e.g. when a supplier delivery arrives. Every item has a `productId`, a `quantity` and a `changeType` (`Increase` or `Decrease`). All items are validated first and applied in a single transaction: if any of them fails, none is applied. Only the "Warehouse Manager" has authorization for this.')
+@api_view(['POST'])
+@permission_classes([permissions.IsWareHouseManager])
+@parser_classes([CamelCaseJSONParser])
+def bulk_stock_update(request):
+    serializer = serializers.BulkStockUpdateSerializer(data=request.data, context={'request': request})
+    serializer.is_valid(raise_exception=True)
+    results = serializer.save()
+    return Response({'results': results})
+
+
+@method_decorator(replicas.replica_reads, name='dispatch')
 class StockMovementListView(generics.ListAPIView):
     """
     This endpoint returns a list of stock_movement objects. The records returned here are generated when sales are made or when the warehouse is restocked
@@ -268,9 +407,10 @@ class StockMovementListView(generics.ListAPIView):
     serializer_class = serializers.StockMovementSerializer
     filter_backends = [django_filters.rest_framework.DjangoFilterBackend]
     filterset_class = utils.StockMovementFilter
+    pagination_class = StockMovementCursorPagination
 
     def get_queryset(self):
-        return models.StockMovement.objects.all()
+        return models.StockMovement.objects.select_related('product', 'user', 'invoice')
 
 
 @extend_schema(methods=['post'], request=serializers.InvoiceCreateSerializer)
@@ -284,17 +424,28 @@ def create_invoice(request):
     return Response(serializers.InvoiceSerializer(invoice).data)
 
 
-@api_view()
-def list_invoices(request):
-    invoices = models.Invoice.objects.filter(status=models.ACTIVE)
-    return Response(serializers.InvoiceSerializer(invoices, many=True).data)
+@method_decorator(replicas.replica_reads, name='dispatch')
+class InvoiceListView(generics.ListAPIView):
+    """
+    This endpoint returns a list of active invoices, newest first. It can be filtered by invoice status, creation date range and customer name
+    """
+    serializer_class = serializers.InvoiceSerializer
+    filter_backends = [django_filters.rest_framework.DjangoFilterBackend]
+    filterset_class = utils.InvoiceFilter
+    pagination_class = InvoiceCursorPagination
+
+    def get_queryset(self):
+        return models.Invoice.objects.filter(status=models.ACTIVE).prefetch_related(utils.invoice_products_prefetch())
 
 
 @extend_schema(description='This endpoint returns the details of a single invoice')
 @api_view()
 def retrieve_invoice(request, pk):
-    invoice = models.Invoice.objects.filter(status=models.ACTIVE).get(id=pk)
-    return Response(serializers.InvoiceSerializer(invoice).data)
+    def build_response():
+        invoice = models.Invoice.objects.filter(status=models.ACTIVE).prefetch_related(utils.invoice_products_prefetch()).get(id=pk)
+        return Response(serializers.InvoiceSerializer(invoice).data)
+
+    return caching.cached_response(request, [models.Invoice, models.InvoiceProduct, models.Product], build_response)
 
 
 @extend_schema(methods=['patch'], request=serializers.InvoiceUpdateSerializer)
@@ -314,9 +465,14 @@ def update_invoice(request, pk):
 @api_view(['DELETE'])
 @permission_classes([permissions.IsCashier])
 def delete_invoice(request, pk):
-    invoice = models.Invoice.objects.filter(status=models.ACTIVE).get(id=pk)
-    invoice.status = models.INACTIVE
-    invoice.save()
+    with transaction.atomic():
+        invoice = models.Invoice.objects.select_for_update().filter(status=models.ACTIVE).get(id=pk)
+        invoice.status = models.INACTIVE
+        invoice.save()
+        if invoice.date_paid:
+            utils.record_invoice_sales(invoice, sign=-1)
+        if invoice.date_supplied:
+            utils.record_invoice_delivery(invoice, sign=-1)
     return Response(status=204)
 
 
@@ -324,10 +480,15 @@ def delete_invoice(request, pk):
 @api_view()
 @permission_classes([permissions.IsCashier])
 def pay_invoice(request, pk):
-    invoice = models.Invoice.objects.filter(status=models.ACTIVE).get(id=pk)
-    invoice.invoice_status = models.Invoice.PAID
-    invoice.date_paid = datetime.datetime.now()
-    invoice.save()
+    with transaction.atomic():
+        # Locked before the status check, so concurrent requests cannot both record the payment
+        invoice = models.Invoice.objects.select_for_update().filter(status=models.ACTIVE).get(id=pk)
+        if invoice.invoice_status != models.Invoice.PENDING:
+            raise ValueError('This invoice has already been paid')
+        invoice.invoice_status = models.Invoice.PAID
+        invoice.date_paid = timezone.now()
+        invoice.save()
+        utils.record_invoice_sales(invoice)
     return Response({'detail': 'Invoice paid'})
 
 
@@ -335,11 +496,154 @@ def pay_invoice(request, pk):
 @api_view()
 @permission_classes([permissions.IsSalesperson])
 def supply_invoice(request, pk):
-    invoice = models.Invoice.objects.filter(status=models.ACTIVE).get(id=pk)
-    if invoice.invoice_status != models.Invoice.PAID:
-        raise ValueError('This invoice has not been paid yet')
-    supply_invoice_items(invoice, request.user)
-    invoice.invoice_status = models.Invoice.DELIVERED
-    invoice.date_supplied = datetime.datetime.now()
-    invoice.save()
+    with transaction.atomic():
+        # Locked before the status check, so concurrent requests cannot both take the items out of stock
+        invoice = models.Invoice.objects.select_for_update().filter(status=models.ACTIVE).get(id=pk)
+        if invoice.invoice_status != models.Invoice.PAID:
+            raise ValueError('This invoice has not been paid yet')
+        supply_invoice_items(invoice, request.user)
+        invoice.invoice_status = models.Invoice.DELIVERED
+        invoice.date_supplied = timezone.now()
+        invoice.save()
+        utils.record_invoice_delivery(invoice)
     return Response({'detail': 'Invoice supplied'})
+
+
+def filtered_queryset(filterset_class, request, queryset):
+    filterset = filterset_class(request.GET, queryset=queryset, request=request)
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    return filterset.qs
+
+
+def streaming_export(request, fields, queryset, file_format, filename):
+    """
+    Streams the `fields` of `queryset` as CSV or NDJSON, EXPORT_CHUNK_SIZE rows per query. Under ASGI the rows are
+    read asynchronously, since Django collects a synchronous iterator into memory before sending it there.
+    """
+    if file_format not in utils.EXPORT_CONTENT_TYPES:
+        raise NotFound(f'Unsupported export format "{file_format}". Use one of: {", ".join(utils.EXPORT_CONTENT_TYPES)}')
+    rows = queryset.values_list(*fields.values())
+    if isinstance(request._request, ASGIRequest):
+        lines = utils.aexport_lines(list(fields), utils.aiterate(rows, EXPORT_CHUNK_SIZE), file_format)
+    else:
+        lines = utils.export_lines(list(fields), rows.iterator(chunk_size=EXPORT_CHUNK_SIZE), file_format)
+    response = StreamingHttpResponse(lines, content_type=utils.EXPORT_CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
+
+
+@replicas.replica_reads
+@extend_schema(description='This endpoint streams all stock movements as `csv` or `ndjson`, oldest first. It accepts the same filters as the stock movement list')
+@api_view()
+@permission_classes([IsAuthenticated])
+def export_stock_movements(request, file_format):
+    queryset = filtered_queryset(utils.StockMovementFilter, request, models.StockMovement.objects.order_by('date', 'id'))
+    return streaming_export(request, STOCK_MOVEMENT_EXPORT_FIELDS, queryset, file_format, 'stock-movements')
+
+
+@replicas.replica_reads
+@extend_schema(description='This endpoint streams the lines of all active invoices as `csv` or `ndjson`, one row per invoiced product. It accepts the same filters as the invoice list')
+@api_view()
+@permission_classes([IsAuthenticated])
+def export_invoices(request, file_format):
+    invoices = filtered_queryset(utils.InvoiceFilter, request, models.Invoice.objects.filter(status=models.ACTIVE))
+    queryset = models.InvoiceProduct.objects.filter(invoice__in=invoices.values('id')).order_by('invoice_id', 'id')
+    return streaming_export(request, INVOICE_EXPORT_FIELDS, queryset, file_format, 'invoices')
+
+
+@replicas.replica_reads
+@extend_schema(description='This endpoint returns the value of the active stock (`stockValue * unitPrice`) per supplier, highest first, and in total')
+@api_view()
+@permission_classes([IsAuthenticated])
+def analytics_stock_value(request):
+    return Response(analytics.cached('stock_value', {}, analytics.stock_value_by_supplier))
+
+
+@replicas.replica_reads
+@extend_schema(parameters=[serializers.MovementVelocityQuerySerializer], description='This endpoint returns the stock movement totals of the last `days` days, either per product (with the average daily decrease and the number of days the current stock lasts at that pace) or per product and day')
+@api_view()
+@permission_classes([IsAuthenticated])
+def analytics_movement_velocity(request):
+    serializer = serializers.MovementVelocityQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+    return Response(analytics.cached(
+        'movement_velocity', params,
+        lambda: analytics.movement_velocity(params['days'], params['group_by'], params.get('product'))
+    ))
+
+
+@replicas.replica_reads
+@extend_schema(parameters=[serializers.TopProductsQuerySerializer], description='This endpoint returns the best selling products by revenue over paid and delivered invoices, optionally limited to invoices paid within a date range')
+@api_view()
+@permission_classes([IsAuthenticated])
+def analytics_top_products(request):
+    serializer = serializers.TopProductsQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+    return Response(analytics.cached(
+        'top_products', params,
+        lambda: analytics.top_products(params['limit'], params.get('date_from'), params.get('date_to'))
+    ))
+
+
+@replicas.replica_reads
+@extend_schema(parameters=[serializers.DailySalesQuerySerializer], description='This endpoint returns the quantity sold, revenue and quantity delivered per day, for all products or for a single `product`. It reads the daily sales rollup')
+@api_view()
+@permission_classes([IsAuthenticated])
+def analytics_daily_sales(request):
+    serializer = serializers.DailySalesQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+    return Response(analytics.cached(
+        'daily_sales', params,
+        lambda: analytics.daily_sales(params.get('date_from'), params.get('date_to'), params.get('product'))
+    ))
+
+
+class SyncListView(generics.ListAPIView):
+    """
+    Base view of the delta sync endpoints. Returns the objects modified since `since` (all of them when omitted),
+    including inactive ones as tombstones, oldest change first. Clients keep following `next` and then store the
+    `watermark` of the last page for their next sync. Responds 304 to an `If-Modified-Since` covering every change.
+    """
+    filter_backends = [django_filters.rest_framework.DjangoFilterBackend]
+    filterset_class = utils.SyncFilter
+    pagination_class = SyncCursorPagination
+
+    def list(self, request, *args, **kwargs):
+        last_modified = self.filter_queryset(self.get_queryset()).aggregate(last_modified=Max('modified'))['last_modified']
+        # Only advertise a Last-Modified that no later write can fall behind, as HTTP dates have whole seconds
+        settled = last_modified and last_modified <= timezone.now() - datetime.timedelta(seconds=settings.SYNC_SAFETY_WINDOW)
+        if settled:
+            last_modified_header = http_date(math.ceil(last_modified.timestamp()))
+            if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+            if if_modified_since and last_modified.timestamp() <= if_modified_since:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'Last-Modified': last_modified_header})
+
+        response = super().list(request, *args, **kwargs)
+        if settled:
+            response['Last-Modified'] = last_modified_header
+        return response
+
+
+class SupplierSyncView(SyncListView):
+    serializer_class = serializers.SupplierSyncSerializer
+
+    def get_queryset(self):
+        return models.Supplier.objects.all()
+
+
+class ProductSyncView(SyncListView):
+    serializer_class = serializers.ProductSyncSerializer
+
+    def get_queryset(self):
+        return models.Product.objects.select_related('supplier')
+
+
+class InvoiceSyncView(SyncListView):
+    serializer_class = serializers.InvoiceSyncSerializer
+
+    def get_queryset(self):
+        return models.Invoice.objects.prefetch_related(utils.invoice_products_prefetch())